@@ -1,17 +1,10 @@
 import streamlit as st
-import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-import numpy as np
-import pyrebase
-import requests
+import time
 import urllib.parse
+# pandas, rfm (pyarrow, sklearn), pyrebase, requests y plotly se importan dentro de las funciones que los usan:
+# la página de login no paga su coste de arranque y cada rerun solo importa lo que va a ejecutar
 # from firebase_config import firebaseConfig  # Eliminado, ahora se usa st.secrets
 
-firebaseConfig = st.secrets["firebaseConfig"]
-firebase = pyrebase.initialize_app(firebaseConfig)
-auth = firebase.auth()
-
 st.set_page_config(page_title="Disruptivos - RFM", layout="wide")
 
 MAILCHIMP_CLIENT_ID = st.secrets["mailchimp"]["client_id"]
@@ -20,52 +13,137 @@ MAILCHIMP_REDIRECT_URI = st.secrets["mailchimp"]["redirect_uri"]
 MAILCHIMP_AUTH_URL = "https://login.mailchimp.com/oauth2/authorize"
 MAILCHIMP_TOKEN_URL = "https://login.mailchimp.com/oauth2/token"
 MAILCHIMP_METADATA_URL = "https://login.mailchimp.com/oauth2/metadata"
+# Aviso de cada problema de validación (ver rfm.ISSUES); los de rfm.BLOCKING detienen la app
+ISSUE_MESSAGES = {
+    "empty": "Hay celdas vacías en las columnas obligatorias. Por favor, revisa tu archivo antes de continuar.",
+    "bad_date": "Algunas fechas no tienen el formato correcto (deben ser DD/MM/AAAA o similar). Revisa las filas resaltadas:",
+    "bad_amount": "Algunos importes o números de compras no tienen un formato numérico válido (por ejemplo 1.234,56). Revisa las filas resaltadas:",
+    "bad_email": "Correos electrónicos con formato no válido; no se podrán exportar a Mailchimp",
+    "duplicate": "Filas repetidas exactamente; cuentan varias veces en la frecuencia y el importe",
+}
+# Segundos que se reutilizan el endpoint y las audiencias de Mailchimp entre reruns
+MAILCHIMP_CACHE_TTL = 600
+# Segundos entre consultas del estado de un análisis en segundo plano
+JOB_POLL_INTERVAL = 0.5
+
+@st.cache_resource(show_spinner=False)
+def get_backend():
+    # Backend de análisis compartido por todas las sesiones: el servicio de `python -m rfm.service` si
+    # RFM_SERVICE_URL apunta a él (compartido también entre procesos de Streamlit) o un rfm.Service dentro
+    # de este proceso. Ambos tienen los mismos métodos, así que la app no distingue entre ellos
+    import rfm
+
+    return rfm.Client(rfm.SERVICE_URL) if rfm.SERVICE_URL else rfm.default_service()
 
-def perform_rfm_analysis(df):
-    if df.empty:
-        return None, None
-    now = df['Fecha de última compra'].max() + pd.Timedelta(days=1)
-    rfm = df.groupby('Correo electrónico').agg({
-        'Fecha de última compra': lambda date: (now - date.max()).days,
-        'Total de compras': 'sum',
-        'Importe total': 'sum'
-    })
-    rfm.columns = ['Recency', 'Frequency', 'Monetary']
-    rfm = rfm[(rfm['Frequency'] > 0) & (rfm['Monetary'] > 0)]
-    if rfm.empty:
-        return None, None
-    scaler = StandardScaler()
-    rfm_scaled = scaler.fit_transform(np.log1p(rfm))
-    n_clusters = 5
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto')
-    rfm['Cluster'] = kmeans.fit_predict(rfm_scaled)
-    cluster_analysis = rfm.groupby('Cluster').agg({
-        'Recency': 'mean',
-        'Frequency': 'mean',
-        'Monetary': 'mean',
-        'Cluster': 'size'
-    }).rename(columns={'Cluster': 'Count'})
-    cluster_analysis = cluster_analysis.sort_values(by=['Recency', 'Frequency', 'Monetary'], ascending=[True, False, False])
-    return cluster_analysis, rfm
-
-def generate_report_text(cluster_analysis):
-    report_lines = ["# Informe de Análisis de Segmentación de Clientes RFM\n\n"]
-    report_lines.append("## Resumen de los Segmentos\n")
-    report_lines.append(cluster_analysis.to_markdown(index=False))
-    report_lines.append("\n\n## Propuestas de Acción por Segmento\n")
-    segment_names_list = ["Clientes Campeones", "Clientes Leales", "Potencialmente Leales", "Clientes en Riesgo", "Clientes Dormidos"]
-    for i, (cluster_id, data) in enumerate(cluster_analysis.iterrows()):
-        segment_name = segment_names_list[i] if i < len(segment_names_list) else f"Segmento {i+1}"
-        report_lines.append(f"### {segment_name} ({int(data['Count'])} clientes)\n")
-        report_lines.append(f"- **Características:** Recencia media de **{int(data['Recency'])} días**, Frecuencia media de **{data['Frequency']:.1f} compras**, Gasto medio de **{data['Monetary']:.2f} €**.\n")
-        report_lines.append("\n")
-    return "\n".join(report_lines)
+@st.cache_resource(show_spinner=False)
+def get_auth():
+    # Cliente de Firebase creado una vez por proceso, no en cada rerun del script
+    import pyrebase
+
+    return pyrebase.initialize_app(st.secrets["firebaseConfig"]).auth()
 
 def reset_analysis():
     st.session_state.analysis_done = False
     st.session_state.results = None
+    st.session_state.validation = None
+    st.session_state.analysis_job = None
+    st.session_state.result_key = None
+    st.session_state.segment_profile = None
+    st.session_state.export = None
+
+def upload_key(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+
+def validate_upload(uploaded_file):
+    # El servicio guarda una copia del fichero (una por contenido), lo valida en una sola pasada
+    # (rfm.Validator) y escribe el almacén Arrow que usará el análisis; si otra sesión ya subió el mismo
+    # export, la validación sale de su caché
+    key = upload_key(uploaded_file)
+    cached = st.session_state.get("validation")
+    if cached is not None and cached["key"] == key:
+        return cached
+    validation = {"key": key, **get_backend().upload(uploaded_file, uploaded_file.name)}
+    st.session_state.validation = validation
+    return validation
+
+def load_results(key):
+    # Resultado terminado (en la caché del servicio) a la sesión; la tabla por cliente llega compacta
+    backend = get_backend()
+    result = backend.result(key)
+    if result is None:
+        st.error("El resultado ya no está disponible en el servicio. Vuelve a lanzar el análisis.")
+        return
+    st.session_state.results = result
+    st.session_state.result_key = key
+    st.session_state.clustering_report = backend.report(key)
+    st.session_state.analysis_done = True
+
+def prepare_export(key, fmt):
+    # Callback del botón "Preparar descarga": genera (o recupera) solo el formato elegido
+    try:
+        path = get_backend().export(key, fmt)
+    except (KeyError, rfm.ServiceError):
+        path = None
+    st.session_state.export = {"key": key, "fmt": fmt, "path": path}
+
+def segment_profile(cluster_analysis, rfm_data):
+    # Resumen por segmento y sus gráficas, calculados una vez por resultado: mover el slider del simulador
+    # solo lee de aquí
+    import rfm
+
+    cached = st.session_state.get("segment_profile")
+    if cached is not None and cached[0] == st.session_state.result_key:
+        return cached[1]
+    profile = rfm.SegmentProfile(cluster_analysis, rfm_data)
+    st.session_state.segment_profile = (st.session_state.result_key, profile)
+    return profile
+
+def record_trace(section, tracer):
+    # Guarda los spans de una parte de la app para el panel de depuración
+    if tracer is not None and tracer.records:
+        st.session_state.trace[section] = tracer.records
+
+def debug_panel():
+    if not st.session_state.get("debug") or not st.session_state.trace:
+        return
+    import rfm
+
+    with st.expander("🛠️ Depuración: tiempos, filas y memoria por etapa", expanded=True):
+        for section, records in st.session_state.trace.items():
+            st.caption(section)
+            st.dataframe(rfm.records_frame(records), use_container_width=True)
+
+def poll_analysis():
+    # Muestra el avance del análisis en segundo plano y vuelve a ejecutar el script hasta que termina
+    import rfm
+
+    job_info = st.session_state.get("analysis_job")
+    if job_info is None:
+        return
+    job = get_backend().job_status(job_info["id"])
+    if job is None:
+        st.session_state.analysis_job = None
+        st.error("No se encontró el análisis en curso. Vuelve a lanzarlo.")
+        return
+    if not job["done"]:
+        st.progress(job["progress"], text=f"{job['label']}...")
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    st.session_state.analysis_job = None
+    if job["status"] == rfm.FAILED:
+        st.error(f"Error durante el análisis: {job['error']}")
+        return
+    if job["spans"]:
+        st.session_state.trace["Análisis"] = job["spans"]
+    if job["empty"]:
+        st.session_state.results = (None, None)
+        st.session_state.analysis_done = True
+        return
+    load_results(job_info["key"])
 
 def main_app():
+    import rfm
+
     st.title("Disruptivos - RFM")
     st.markdown("""
     ### Instrucciones para subir tu archivo CSV
@@ -96,56 +174,48 @@ def main_app():
     """)
     uploaded_file = st.file_uploader("1. Elige un fichero CSV o Excel", type=["csv", "xlsx"], on_change=reset_analysis)
     if uploaded_file is not None:
-        # Detectar tipo de archivo y leerlo
+        # Detectar tipo de archivo y leer solo la cabecera; los datos se leen por trozos más abajo
         try:
-            if uploaded_file.name.endswith(".csv"):
-                df = pd.read_csv(uploaded_file)
-                st.success("Archivo CSV cargado correctamente.")
-            elif uploaded_file.name.endswith(".xlsx"):
-                df = pd.read_excel(uploaded_file)
-                st.success("Archivo Excel cargado correctamente.")
-            else:
-                st.error("Formato de archivo no soportado. Sube un archivo .csv o .xlsx.")
-                st.stop()
+            file_columns = rfm.read_header(uploaded_file)
+            st.success("Archivo cargado correctamente.")
         except Exception as e:
             st.error(f"Error al leer el archivo: {e}")
             st.stop()
 
         # Validación previa de columnas necesarias
-        required_cols = [
-            "Correo electrónico",
-            "Fecha de última compra",
-            "Importe total",
-            "Total de compras",
-            "Suscrito a newsletter"
-        ]
-        missing_cols = [col for col in required_cols if col not in df.columns]
+        missing_cols = rfm.missing_columns(file_columns)
         if missing_cols:
             st.error(f"Faltan las siguientes columnas obligatorias en tu archivo: {', '.join(missing_cols)}")
             st.stop()
 
-        # Validación de datos vacíos
-        if df[required_cols].isnull().any().any():
-            st.warning("Hay celdas vacías en las columnas obligatorias. Por favor, revisa tu archivo antes de continuar.")
-            st.dataframe(df[df[required_cols].isnull().any(axis=1)])
-            st.stop()
-
-        # Validación de formato de fecha
+        # Validación de datos vacíos, fechas e importes, trozo a trozo y una sola vez por fichero subido
         try:
-            fechas = pd.to_datetime(df["Fecha de última compra"], dayfirst=True, errors="coerce")
-            if fechas.isnull().any():
-                st.warning("Algunas fechas no tienen el formato correcto (deben ser DD/MM/AAAA o similar). Revisa las filas resaltadas:")
-                st.dataframe(df[fechas.isnull()])
-                st.stop()
+            with rfm.tracing(st.session_state.debug, memory=True) as tracer:
+                validation = validate_upload(uploaded_file)
+            record_trace("Validación", tracer)
         except Exception as e:
-            st.error(f"Error en el formato de la columna 'Fecha de última compra': {e}")
+            st.error(f"Error al validar el archivo: {e}")
+            st.stop()
+        issues = validation["issues"]
+        summary = issues.summary()
+        if not summary.empty:
+            st.subheader("Problemas encontrados")
+            st.dataframe(summary, hide_index=True)
+        for issue in issues.blocking:
+            st.warning(ISSUE_MESSAGES[issue])
+            st.dataframe(issues.rows(issue))
+        if issues.blocking:
+            st.caption(f"Se muestran como máximo {issues.max_rows} filas por problema.")
             st.stop()
+        for issue in ("bad_email", "duplicate"):
+            if issues.counts[issue]:
+                with st.expander(f"{ISSUE_MESSAGES[issue]} ({issues.counts[issue]} filas)"):
+                    st.dataframe(issues.rows(issue))
 
         st.success("Archivo validado correctamente. Ahora puedes mapear las columnas y lanzar el análisis.")
 
         st.header("2. Mapeo de Columnas")
         st.write("Asigna las columnas de tu fichero a los campos requeridos por la aplicación.")
-        file_columns = df.columns.tolist()
         col1, col2, col3 = st.columns(3)
         with col1:
             email_col = st.selectbox("Columna de Correo Electrónico", file_columns, index=0)
@@ -155,21 +225,36 @@ def main_app():
             frequency_col = st.selectbox("Columna de Total de Compras", file_columns, index=3)
         with col3:
             newsletter_col = st.selectbox("Columna de 'Suscrito a Newsletter'", file_columns, index=4)
+        k_options = [rfm.AUTO_K] + list(rfm.K_VALUES)
+        n_clusters = st.selectbox("Número de segmentos", k_options, index=k_options.index(rfm.N_CLUSTERS),
+                                  format_func=lambda k: "Automático (codo y silueta)" if k == rfm.AUTO_K else str(k),
+                                  help=f"En modo automático se prueban varios valores en paralelo durante como máximo {rfm.TIME_BUDGET:.0f} segundos y se elige el de mejor silueta.")
+        engine = st.selectbox("Motor de clustering", list(rfm.ENGINES), format_func=rfm.ENGINES.get,
+                              help="Para bases de clientes muy grandes, MiniBatchKMeans o el ajuste sobre una muestra estratificada mantienen el análisis interactivo. "
+                                   "La puntuación por quintiles no agrupa: da siempre los mismos cinco segmentos y es la opción más rápida (ignora el número de segmentos).")
+        refit = st.checkbox("Reajustar el modelo de segmentación", value=False, disabled=engine == rfm.QUINTILES,
+                            help="Por defecto los clientes se asignan con el último modelo guardado, así que cada segmento conserva su número y su nombre entre análisis. "
+                                 "El modelo solo se reajusta si no existe, si cambias el número de segmentos o si los datos se han alejado demasiado de él (deriva). "
+                                 "Marca esta opción para forzar un ajuste nuevo con este fichero.")
         if st.button("🚀 Realizar Análisis"):
-            df_mapped = df[[email_col, date_col, monetary_col, frequency_col, newsletter_col]].copy()
-            df_mapped.columns = ['Correo electrónico', 'Fecha de última compra', 'Importe total', 'Total de compras', 'Suscrito a newsletter']
-            df_mapped = df_mapped[df_mapped['Suscrito a newsletter'] == 'Si'].copy()
-            df_mapped['Fecha de última compra'] = pd.to_datetime(df_mapped['Fecha de última compra'], dayfirst=True, errors='coerce')
-            df_mapped.dropna(subset=['Fecha de última compra'], inplace=True)
-            for col in ['Importe total', 'Total de compras']:
-                if df_mapped[col].dtype == 'object':
-                    df_mapped[col] = df_mapped[col].str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype(float)
-                else:
-                    df_mapped[col] = df_mapped[col].astype(float)
-            cluster_analysis, rfm_data = perform_rfm_analysis(df_mapped)
-            st.session_state.results = (cluster_analysis, rfm_data)
-            st.session_state.analysis_done = True
+            mapping = dict(zip(rfm.REQUIRED_COLUMNS, [email_col, date_col, monetary_col, frequency_col, newsletter_col]))
+            # Resultado cacheado por contenido del fichero, mapeo, nº de clusters, motor y versión del código:
+            # repetir el análisis del mismo export (en cualquier sesión) no recalcula nada. Si no está, el
+            # servicio lo calcula en su cola de trabajos (una vez aunque lo pidan varias sesiones) y la sesión
+            # consulta su avance en cada rerun
+            try:
+                analysis = get_backend().analyze(validation["digest"], uploaded_file.name, mapping, n_clusters, engine,
+                                                 trace=st.session_state.debug, refit=refit)
+            except Exception as e:
+                st.error(f"No se pudo lanzar el análisis: {e}")
+                st.stop()
+            if analysis["job"] is None:
+                load_results(analysis["key"])
+            else:
+                st.session_state.analysis_job = {"id": analysis["job"], "key": analysis["key"]}
+                st.session_state.analysis_done = False
             st.rerun()
+        poll_analysis()
     if st.session_state.analysis_done:
         st.header("3. Resultados del Análisis")
         if st.session_state.results:
@@ -177,38 +262,65 @@ def main_app():
             if cluster_analysis is None or rfm_data is None:
                 st.warning("No se encontraron clientes suscritos a la newsletter con datos válidos para analizar con el mapeo proporcionado.")
             else:
-                st.write("La siguiente tabla muestra los 5 segmentos de clientes identificados, ordenados del más al menos valioso según sus características de compra.")
+                st.write(f"La siguiente tabla muestra los {len(cluster_analysis)} segmentos de clientes identificados, ordenados del más al menos valioso según sus características de compra.")
                 st.table(cluster_analysis.style.format({
                     'Recency': '{:.0f} días',
                     'Frequency': '{:.1f} compras',
                     'Monetary': '{:.2f} €',
                     'Count': '{:,.0f} clientes'
-                }))
-                # Gráfica de barras de segmentos
-                segment_names_list = ["Clientes Campeones", "Clientes Leales", "Potencialmente Leales", "Clientes en Riesgo", "Clientes Dormidos"]
-                chart_data = cluster_analysis.reset_index()
-                chart_data['Segmento'] = chart_data.index.map(lambda i: segment_names_list[i] if i < len(segment_names_list) else f"Segmento {i+1}")
-                st.bar_chart(chart_data, x="Segmento", y="Count")
-
-                # Gráfica de pastel para distribución porcentual
-                import plotly.express as px
-                pie_fig = px.pie(chart_data, names="Segmento", values="Count", title="Distribución porcentual de los segmentos")
-                st.plotly_chart(pie_fig, use_container_width=True)
-                segment_names_list = ["Clientes Campeones", "Clientes Leales", "Potencialmente Leales", "Clientes en Riesgo", "Clientes Dormidos"]
-                sorted_cluster_ids = cluster_analysis.index.tolist()
-                cluster_id_to_name_map = {cluster_id: segment_names_list[i] for i, cluster_id in enumerate(sorted_cluster_ids)}
-                rfm_data['Segmento'] = rfm_data['Cluster'].map(cluster_id_to_name_map)
+                }, na_rep="—"))
+                report = st.session_state.get("clustering_report")
+                if report and report["engine"] == rfm.QUINTILES:
+                    st.caption(f"Segmentos por puntuación R/F/M en quintiles sobre {report['n_customers']:,} clientes "
+                               f"en {report['predict_seconds']:.2f} s, sin clustering: el resultado es siempre el mismo.")
+                elif report and not report.get("refit", True):
+                    drift = f", deriva {report['drift']:.0%}" if "drift" in report else ""
+                    st.caption(f"{report['n_customers']:,} clientes asignados con el modelo de segmentación guardado "
+                               f"(versión {report['model_version']}) en {report['score_seconds'] * 1000:.0f} ms{drift}.")
+                elif report:
+                    refit_note = f"Modelo reajustado y guardado como versión {report['model_version']}. " if report.get("refit") else ""
+                    st.caption(f"{refit_note}Clustering con {rfm.ENGINES[report['engine']]} sobre {report['n_customers']:,} clientes "
+                               f"(ajuste con {report['n_fit']:,}): ajuste {report['fit_seconds']:.2f} s, "
+                               f"asignación {report['predict_seconds']:.2f} s, inercia {report['inertia']:,.0f}.")
+                elif report is not None:
+                    st.caption("Resultado recuperado de la caché de análisis.")
+                if report and report.get("k_fallback"):
+                    st.warning(f"No dio tiempo a evaluar ningún número de segmentos en {report['time_budget']:g} s: se han usado "
+                               f"{report['n_clusters']} segmentos por defecto. Elige el número a mano o aumenta RFM_TIME_BUDGET.")
+                elif report and "selection" in report:
+                    with st.expander("Selección automática del número de segmentos"):
+                        st.write(f"Se han elegido {report['n_clusters']} segmentos (mayor silueta). Una caída de inercia pequeña al añadir un segmento indica el codo.")
+                        st.dataframe(report["selection"].rename(columns={
+                            'inertia': 'Inercia', 'silhouette': 'Silueta', 'seconds': 'Segundos', 'inertia_drop': 'Caída de inercia'}))
+                profile = segment_profile(cluster_analysis, rfm_data)
+                segment_names_list = profile.labels
+                # Gráficas de barras, pastel e ingresos (figuras creadas una vez por resultado)
+                st.plotly_chart(profile.figure("bar"), use_container_width=True)
+                st.plotly_chart(profile.figure("pie"), use_container_width=True)
+                st.plotly_chart(profile.figure("revenue"), use_container_width=True)
                 st.subheader("Descargas")
-                col1, col2 = st.columns(2)
-                with col1:
-                    report_text = generate_report_text(cluster_analysis)
-                    st.download_button(label="📥 Descargar Informe de Análisis", data=report_text, file_name="informe_segmentacion_rfm.md", mime="text/markdown")
-                with col2:
-                    csv_export = rfm_data.reset_index()[['Correo electrónico', 'Segmento']].to_csv(index=False).encode('utf-8')
-                    st.download_button(label="📧 Descargar CSV con Correos por Segmento", data=csv_export, file_name="correos_por_segmento.csv", mime="text/csv")
+                # Solo se genera el formato elegido, al pulsar el botón: cada fichero se escribe por trozos una sola
+                # vez por resultado y los reruns solo abren el ya preparado, no los cuatro
+                export_fmt = st.selectbox("Formato de descarga", list(rfm.FORMATS), format_func=lambda fmt: rfm.FORMATS[fmt][0],
+                                          key="export_format")
+                st.button("Preparar descarga", on_click=prepare_export, args=(st.session_state.result_key, export_fmt))
+                export = st.session_state.get("export")
+                if export and export["key"] == st.session_state.result_key and export["fmt"] == export_fmt:
+                    if export["path"] is None:
+                        # El resultado salió de la caché del servicio (otras sesiones lo desplazaron) y la descarga no existía
+                        st.warning("Las descargas de este resultado ya no están disponibles. Vuelve a lanzar el análisis para generarlas.")
+                    else:
+                        label, file_name, mime = rfm.FORMATS[export_fmt]
+                        try:
+                            with open(export["path"], "rb") as f:
+                                st.download_button(label=label, data=f, file_name=file_name, mime=mime, key=f"download_{export_fmt}")
+                        except FileNotFoundError:
+                            # Borrado por la expulsión del directorio de descargas: se vuelve a preparar con el botón
+                            st.info("La descarga preparada ya no está en disco. Pulsa «Preparar descarga» de nuevo.")
                 st.subheader("Propuestas de Acción por Segmento")
-                for i, (cluster_id, data) in enumerate(cluster_analysis.iterrows()):
-                    segment_name = segment_names_list[i] if i < len(segment_names_list) else f"Segmento {i+1}"
+                # Los segmentos sin clientes (posibles con el motor por quintiles) no tienen medias que comentar
+                for cluster_id, data in rfm.named_summary(cluster_analysis).iterrows():
+                    segment_name = data['Segmento']
                     with st.expander(f"Acciones para: **{segment_name}** ({int(data['Count'])} clientes)"):
                         st.markdown(f"""
                         - **Características:** 
@@ -233,12 +345,12 @@ def main_app():
                 sim_segmento = st.selectbox("Selecciona un segmento para simular la campaña", segment_names_list)
                 sim_tipo = st.selectbox("Tipo de campaña", ["Descuento directo", "Email personalizado", "Cross-selling", "Última oportunidad"])
                 sim_conversion = st.slider("% estimado de conversión o reactivación", min_value=1, max_value=100, value=10)
-                sim_data = cluster_analysis.reset_index().iloc[segment_names_list.index(sim_segmento)]
-                n_clientes = int(sim_data['Count'])
-                clientes_impactados = int(n_clientes * sim_conversion / 100)
-                gasto_medio = sim_data['Monetary']
-                ingreso_estimado = clientes_impactados * gasto_medio
-                st.markdown(f"**Impacto estimado:** Si lanzas una campaña de tipo *{sim_tipo}* al segmento *{sim_segmento}* y logras un {sim_conversion}% de conversión, impactarás a **{clientes_impactados} clientes** y podrías generar aproximadamente **{ingreso_estimado:,.2f} €** en ingresos.")
+                sim = profile.simulate(sim_segmento, sim_conversion)
+                st.markdown(f"**Impacto estimado:** Si lanzas una campaña de tipo *{sim_tipo}* al segmento *{sim_segmento}* y logras un {sim_conversion}% de conversión, impactarás a **{sim['customers']} clientes** y podrías generar aproximadamente **{sim['revenue']:,.2f} €** en ingresos.")
+                st.caption(f"Rango probable (95 %): entre {sim['low']:,.2f} € y {sim['high']:,.2f} €, según qué clientes respondan. "
+                           f"Gasto medio del segmento {sim['mean']:,.2f} €, mediana {sim['median']:,.2f} €.")
+                with st.expander("Distribución del gasto por segmento"):
+                    st.dataframe(profile.quantiles.rename(columns=lambda q: f"P{q * 100:.0f}").style.format("{:,.2f} €"))
 
                 # Exportar segmento a Mailchimp
                 mailchimp_export_segment(rfm_data, segment_names_list)
@@ -249,7 +361,7 @@ def login_form():
     password = st.text_input('Contraseña', type='password')
     if st.button('Iniciar sesión'):
         try:
-            user = auth.sign_in_with_email_and_password(email, password)
+            user = get_auth().sign_in_with_email_and_password(email, password)
             st.session_state['user'] = user
             st.success('¡Login correcto!')
             st.rerun()
@@ -263,6 +375,7 @@ def register_form():
     password = st.text_input('Contraseña', type='password', key='reg_pass')
     if st.button('Crear cuenta'):
         try:
+            auth = get_auth()
             user = auth.create_user_with_email_and_password(email, password)
             # Guardar el nombre en el perfil de usuario
             auth.update_profile(user['idToken'], display_name=name)
@@ -294,6 +407,9 @@ def mailchimp_oauth_flow():
             if isinstance(code, list):
                 code = code[0]
             # Paso 3: Intercambiar code por access token
+            import mailchimp_api
+            import requests
+
             data = {
                 "grant_type": "authorization_code",
                 "client_id": MAILCHIMP_CLIENT_ID,
@@ -302,40 +418,54 @@ def mailchimp_oauth_flow():
                 "code": code,
             }
             try:
-                resp = requests.post(MAILCHIMP_TOKEN_URL, data=data)
-                resp.raise_for_status()
-                token = resp.json()["access_token"]
+                token = mailchimp_api.exchange_code(mailchimp_api.MailchimpClient(), MAILCHIMP_TOKEN_URL, data)
                 st.session_state["mailchimp_token"] = token
                 st.success("¡Conexión con Mailchimp realizada con éxito!")
                 st.query_params.clear()
             except Exception as e:
                 st.error(f"Error al obtener el token de Mailchimp: {e}")
-                st.write(resp.text)  # Esto mostrará el mensaje de error detallado de Mailchimp
+                if isinstance(e, requests.HTTPError):
+                    st.write(e.response.text)  # Esto mostrará el mensaje de error detallado de Mailchimp
     else:
         st.success("Cuenta de Mailchimp conectada correctamente.")
         if st.button("Desconectar Mailchimp"):
             del st.session_state["mailchimp_token"]
             st.experimental_rerun()
 
+@st.cache_data(ttl=MAILCHIMP_CACHE_TTL, show_spinner=False)
+def cached_mailchimp_endpoint(token):
+    import mailchimp_api
+
+    return mailchimp_api.get_api_endpoint(mailchimp_api.MailchimpClient(token), MAILCHIMP_METADATA_URL)
+
+@st.cache_data(ttl=MAILCHIMP_CACHE_TTL, show_spinner=False)
+def cached_mailchimp_lists(token, api_endpoint, refresh=0):
+    # refresh es el nº de veces que la sesión pidió refrescar: cambia la entrada de la caché solo para ella,
+    # sin vaciar las listas cacheadas del resto de usuarios (lo que haría cached_mailchimp_lists.clear())
+    import mailchimp_api
+
+    return mailchimp_api.get_lists(mailchimp_api.MailchimpClient(token, api_endpoint))
+
 def mailchimp_export_segment(rfm_data, segment_names_list):
     st.subheader("Exportar segmento a Mailchimp")
     token = st.session_state.get("mailchimp_token")
     if not token:
         st.info("Conecta primero tu cuenta de Mailchimp para exportar segmentos.")
         return
-    # 1. Obtener metadata para saber el data center
+    import mailchimp_api
+
+    # 1. Obtener metadata para saber el data center (cacheado por token)
     try:
-        meta_resp = requests.get(MAILCHIMP_METADATA_URL, headers={"Authorization": f"OAuth {token}"})
-        meta_resp.raise_for_status()
-        api_endpoint = meta_resp.json()["api_endpoint"]
+        api_endpoint = cached_mailchimp_endpoint(token)
     except Exception as e:
         st.error(f"No se pudo obtener el endpoint de Mailchimp: {e}")
         return
-    # 2. Obtener listas (audiencias)
+    client = mailchimp_api.MailchimpClient(token, api_endpoint)
+    # 2. Obtener listas (audiencias), cacheadas hasta que caduque el TTL o se pida refrescarlas
+    if st.button("🔄 Refrescar listas de Mailchimp"):
+        st.session_state.mailchimp_refresh = st.session_state.get("mailchimp_refresh", 0) + 1
     try:
-        lists_resp = requests.get(f"{api_endpoint}/3.0/lists", headers={"Authorization": f"OAuth {token}"})
-        lists_resp.raise_for_status()
-        lists = lists_resp.json()["lists"]
+        lists = cached_mailchimp_lists(token, api_endpoint, st.session_state.get("mailchimp_refresh", 0))
         if not lists:
             st.warning("No se encontraron listas en tu cuenta de Mailchimp. Crea una lista primero.")
             return
@@ -354,23 +484,38 @@ def mailchimp_export_segment(rfm_data, segment_names_list):
         if not emails:
             st.warning("No hay emails en este segmento para exportar.")
             return
-        # 4. Exportar emails a la lista
-        errors = 0
-        for email in emails:
-            data = {"email_address": email, "status": "subscribed"}
-            resp = requests.post(f"{api_endpoint}/3.0/lists/{lista_id}/members", headers={"Authorization": f"OAuth {token}"}, json=data)
-            if resp.status_code not in (200, 204):
-                errors += 1
+        # 4. Exportar emails a la lista (PUT en paralelo si son pocos, batches de Mailchimp si no)
+        progress = st.progress(0.0, text=f"Exportando 0 de {len(emails)} emails...")
+
+        def update_progress(done, total):
+            progress.progress(done / total if total else 1.0, text=f"Exportando {done} de {total} emails...")
+
+        import rfm
+
+        with rfm.tracing(st.session_state.debug) as tracer, rfm.span("mailchimp_export", rows_in=len(emails)) as current:
+            results = mailchimp_api.export_members(client, lista_id, emails, on_progress=update_progress)
+            current.rows_out = int(results["Exportado"].sum())
+        record_trace("Exportación a Mailchimp", tracer)
+        errors = int((~results["Exportado"]).sum())
         if errors == 0:
             st.success(f"Todos los emails del segmento '{segmento}' han sido exportados a la audiencia '{lista_nombre}' de Mailchimp.")
         else:
-            st.warning(f"{errors} emails no pudieron ser exportados (puede que ya existan o haya errores de formato).")
+            st.warning(f"{errors} emails no pudieron ser exportados (puede que haya errores de formato o emails no válidos).")
+        st.dataframe(results, use_container_width=True)
+        with st.expander("Tiempos de las llamadas a Mailchimp"):
+            st.dataframe(client.metrics_frame(), use_container_width=True)
 
 # --- Lógica principal de la aplicación ---
 if 'analysis_done' not in st.session_state:
     st.session_state.analysis_done = False
 if 'results' not in st.session_state:
     st.session_state.results = None
+if 'analysis_job' not in st.session_state:
+    st.session_state.analysis_job = None
+if 'trace' not in st.session_state:
+    st.session_state.trace = {}
+if 'result_key' not in st.session_state:
+    st.session_state.result_key = None
 
 # Mostrar integración Mailchimp siempre, antes del login
 mailchimp_oauth_flow()
@@ -391,4 +536,6 @@ if 'user' not in st.session_state:
 else:
     st.sidebar.write(f"Usuario: {st.session_state['user']['email']}")
     logout()
-    main_app()
\ No newline at end of file
+    st.sidebar.checkbox("Modo depuración", key="debug", help="Mide tiempo, filas y picos de memoria de cada etapa (más lento).")
+    main_app()
+    debug_panel()
\ No newline at end of file
@@ -0,0 +1,82 @@
+# Benchmark de arranque de app.py: primer render en un proceso nuevo (frío) y reruns posteriores (caliente),
+# con la página de login. Informa también de qué módulos pesados quedan cargados tras el render
+# (algunos, como pandas, los puede importar el propio Streamlit).
+# Usa streamlit.testing (AppTest) con secretos ficticios; no hace llamadas a Firebase ni a Mailchimp.
+# Uso: python benchmarks/bench_app_startup.py [reruns] [--output resultados.json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP = os.path.join(ROOT, 'app.py')
+HEAVY_MODULES = ['pandas', 'rfm', 'pyrebase', 'requests', 'plotly', 'sklearn', 'pyarrow']
+
+SECRETS = {
+    'firebaseConfig': {
+        'apiKey': 'bench', 'authDomain': 'bench.firebaseapp.com', 'databaseURL': 'https://bench.firebaseio.com',
+        'projectId': 'bench', 'storageBucket': 'bench.appspot.com', 'messagingSenderId': '0', 'appId': 'bench',
+    },
+    'mailchimp': {'client_id': 'bench', 'client_secret': 'bench', 'redirect_uri': 'http://localhost:8501'},
+}
+
+
+def measure(reruns):
+    # Se ejecuta en un proceso hijo para que el primer render sea realmente en frío
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    import_seconds = time.perf_counter() - start
+    app = AppTest.from_file(APP, default_timeout=60)
+    for section, values in SECRETS.items():
+        app.secrets[section] = values
+    os.chdir(ROOT)
+    start = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - start
+    warm = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        warm.append(time.perf_counter() - start)
+    return {
+        'streamlit_import_seconds': import_seconds,
+        'cold_seconds': cold,
+        'warm_median_seconds': statistics.median(warm) if warm else None,
+        'warm_max_seconds': max(warm) if warm else None,
+        'reruns': reruns,
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+        'exceptions': [str(exc.value) for exc in app.exception],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reruns', nargs='?', type=int, default=20)
+    parser.add_argument('--output')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(args.reruns)))
+        return
+    output = subprocess.run([sys.executable, __file__, str(args.reruns), '--child'], check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"Importar streamlit:     {result['streamlit_import_seconds'] * 1000:8.1f} ms")
+    print(f"Primer render (frío):   {result['cold_seconds'] * 1000:8.1f} ms")
+    if result['warm_median_seconds'] is not None:
+        print(f"Rerun (caliente):       {result['warm_median_seconds'] * 1000:8.1f} ms mediana, "
+              f"{result['warm_max_seconds'] * 1000:.1f} ms máx. ({result['reruns']} reruns)")
+    print(f"Módulos pesados cargados: {', '.join(result['heavy_modules_loaded']) or 'ninguno'}")
+    for exception in result['exceptions']:
+        print(f"Excepción en la app: {exception}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Microbenchmark de la conversión de importes con formato español ("1.234,56").
+#   - en memoria: cadena de .str.replace + astype (versión anterior) frente a rfm.parse_numeric
+#   - en la lectura: read_csv + cadena de replace frente a read_csv con los separadores detectados
+#     por rfm.sniff (el lector C convierte los números sin columnas de texto intermedias)
+# Uso: python benchmarks/bench_numeric_parser.py [filas ...]
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rfm import parse_numeric, parse_numeric_report  # noqa: E402
+from rfm import sniff  # noqa: E402
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+
+
+def make_amounts(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    values = rng.gamma(2.0, 400.0, n_rows)
+    # Formato español: miles con punto y decimales con coma
+    text = pd.Series(values).map(lambda v: f"{v:,.2f}").str.translate(str.maketrans({',': '.', '.': ','}))
+    return text, values.round(2)
+
+
+def parse_replace(series):
+    return series.str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype(float)
+
+
+def read_replace(csv_bytes):
+    column = pd.read_csv(io.BytesIO(csv_bytes))['Importe total']
+    return parse_replace(column)
+
+
+def read_separators(csv_bytes):
+    source = io.BytesIO(csv_bytes)
+    options = sniff(source)
+    return pd.read_csv(source, decimal=options['decimal'], thousands=options['thousands'])['Importe total'].astype(float)
+
+
+def timed(func, arg, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    print(f"{'filas':>10} {'caso':>10} {'anterior (s)':>13} {'nuevo (s)':>10} {'speedup':>8}")
+    for n_rows in sizes:
+        series, expected = make_amounts(n_rows)
+        t_old, old = timed(parse_replace, series)
+        t_new, new = timed(parse_numeric, series)
+        np.testing.assert_allclose(new.to_numpy(), expected)
+        np.testing.assert_allclose(new.to_numpy(), old.to_numpy())
+        print(f"{n_rows:>10,} {'memoria':>10} {t_old:>13.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x")
+
+        frame = pd.DataFrame({'Fecha de última compra': '31/12/2024', 'Importe total': series})
+        csv_bytes = frame.to_csv(index=False).encode('utf-8')
+        t_old, old = timed(read_replace, csv_bytes)
+        t_new, new = timed(read_separators, csv_bytes)
+        np.testing.assert_allclose(new.to_numpy(), old.to_numpy())
+        print(f"{n_rows:>10,} {'lectura':>10} {t_old:>13.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x")
+
+        # Con celdas mal formadas la versión anterior lanza ValueError; la nueva las marca y sigue
+        dirty = series.copy()
+        dirty.iloc[::1000] = 'n/d'
+        _, malformed = parse_numeric_report(dirty)
+        print(f"{n_rows:>10,} {'sucio':>10} {'ValueError':>13} {int(malformed.sum()):>10,} celdas mal formadas")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
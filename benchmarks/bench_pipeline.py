@@ -0,0 +1,160 @@
+# Benchmark del pipeline completo sobre exports sintéticos (ver synthetic.py), de 10k a 10M filas.
+# Mide por etapas: lectura por trozos, limpieza, agregación RFM, conversión y agregación con el almacén
+# Arrow, clustering e informe. Compara con benchmarks/baseline.json y marca las etapas que empeoran.
+# Uso: python benchmarks/bench_pipeline.py [filas ...] [--save-baseline] [--tolerance 0.25] [--repeat 3]
+# Los CSV generados se guardan en RFM_BENCH_DIR (por defecto el directorio temporal) y se reutilizan.
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rfm  # noqa: E402
+from synthetic import write_export  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+BENCH_DIR = os.environ.get('RFM_BENCH_DIR', os.path.join(tempfile.gettempdir(), 'rfm_bench'))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Empeoramiento relativo a partir del cual una etapa se marca como regresión
+TOLERANCE = 0.25
+# Por debajo de este tiempo las diferencias son ruido y no se comparan
+MIN_SECONDS = 0.05
+# Repeticiones por tamaño; de cada etapa se guarda el mejor tiempo
+REPEAT = 3
+
+
+def export_path(n_rows):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f'clientes_{n_rows}.csv')
+    if not os.path.exists(path):
+        write_export(path, n_rows)
+    return path
+
+
+def run_size(n_rows):
+    path = export_path(n_rows)
+    timings = {}
+    # Lectura, limpieza y agregación por trozos (mismo camino que rfm.aggregate_chunks), cronometradas por separado
+    options = rfm.sniff(path)
+    read = clean = aggregate = 0.0
+    parts = []
+    chunks = rfm.iter_chunks(path, rfm.REQUIRED_COLUMNS, options=options)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        read += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        chunk = rfm.clean(chunk, date_format=options.get('date_format'))
+        clean += time.perf_counter() - start
+        start = time.perf_counter()
+        parts.append(rfm.aggregate(chunk))
+        if len(parts) > rfm.scoring.COMBINE_EVERY:
+            parts = [rfm.combine_aggregates(parts)]
+        aggregate += time.perf_counter() - start
+    start = time.perf_counter()
+    rfm_table = rfm.finalize(rfm.combine_aggregates(parts))
+    timings.update(read=read, clean=clean, aggregate=aggregate + time.perf_counter() - start)
+    # Camino del almacén Arrow: conversión una vez y agregación lote a lote sobre el fichero
+    store = os.path.join(BENCH_DIR, f'clientes_{n_rows}.arrow')
+    start = time.perf_counter()
+    rfm.store.convert(path, store, options=options)
+    timings['store_convert'] = time.perf_counter() - start
+    start = time.perf_counter()
+    store_table = rfm.rfm_from_store(store)
+    timings['store_aggregate'] = time.perf_counter() - start
+    os.remove(store)
+    # Mismo resultado por los dos caminos (las sumas pueden diferir en el último decimal por el orden)
+    pd.testing.assert_frame_equal(store_table, rfm_table.sort_index(), check_dtype=False)
+    start = time.perf_counter()
+    clustered, report = rfm.cluster(rfm_table)
+    timings['cluster'] = time.perf_counter() - start
+    start = time.perf_counter()
+    cluster_analysis = rfm.summarize(clustered)
+    rfm.assign_segments(clustered, cluster_analysis)
+    rfm.generate_report_text(cluster_analysis)
+    timings['report'] = time.perf_counter() - start
+    return {'rows': n_rows, 'customers': len(rfm_table), 'engine': report['engine'], 'timings': timings}
+
+
+def best_of(n_rows, repeat=REPEAT):
+    runs = [run_size(n_rows) for _ in range(repeat)]
+    result = runs[0]
+    result['timings'] = {stage: min(run['timings'][stage] for run in runs) for stage in result['timings']}
+    return result
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # Devuelve [(filas, etapa, base, actual)] de las etapas que superan la tolerancia
+    regressions = []
+    for result in results:
+        base = baseline.get('results', {}).get(str(result['rows']))
+        if base is None:
+            continue
+        for stage, seconds in result['timings'].items():
+            reference = base['timings'].get(stage)
+            if reference is None or max(seconds, reference) < MIN_SECONDS:
+                continue
+            if seconds > reference * (1 + tolerance):
+                regressions.append((result['rows'], stage, reference, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda los resultados como nueva línea base")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    # sklearn se importa antes de medir para que el primer tamaño no pague su arranque
+    import sklearn.cluster  # noqa: F401
+
+    results = []
+    stages = None
+    for n_rows in args.sizes:
+        result = best_of(n_rows, args.repeat)
+        results.append(result)
+        if stages is None:
+            stages = list(result['timings'])
+            print(f"{'filas':>10} {'clientes':>10} " + ' '.join(f'{stage:>15}' for stage in stages))
+        print(f"{n_rows:>10} {result['customers']:>10} "
+              + ' '.join(f"{result['timings'][stage]:>14.3f}s" for stage in stages))
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for n_rows, stage, reference, seconds in regressions:
+        print(f"REGRESIÓN {n_rows} filas, {stage}: {reference:.3f}s -> {seconds:.3f}s ({seconds / reference - 1:+.0%})")
+    if baseline and not regressions:
+        print(f"Sin regresiones respecto a la línea base (tolerancia {args.tolerance:.0%}).")
+
+    if args.save_baseline:
+        baseline = {'environment': environment(), 'results': {
+            **baseline.get('results', {}), **{str(result['rows']): result for result in results}}}
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Línea base guardada en {BASELINE}")
+    return 1 if regressions and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+# Benchmark de la agregación RFM: lambda por grupo (versión anterior) frente a reducciones vectorizadas.
+# Uso: python benchmarks/bench_rfm_aggregation.py [filas ...]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rfm import compute_rfm  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_orders(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    n_customers = max(n_rows // 4, 1)
+    return pd.DataFrame({
+        'Correo electrónico': pd.Series(rng.integers(0, n_customers, n_rows)).map(lambda i: f"cliente{i}@email.com"),
+        'Fecha de última compra': pd.Timestamp("2024-12-31") - pd.to_timedelta(rng.integers(0, 2000, n_rows), unit="D"),
+        'Total de compras': rng.integers(1, 10, n_rows).astype(float),
+        'Importe total': rng.gamma(2.0, 40.0, n_rows).round(2),
+    })
+
+
+def rfm_lambda(df):
+    now = df['Fecha de última compra'].max() + pd.Timedelta(days=1)
+    rfm = df.groupby('Correo electrónico').agg({
+        'Fecha de última compra': lambda date: (now - date.max()).days,
+        'Total de compras': 'sum',
+        'Importe total': 'sum'
+    })
+    rfm.columns = ['Recency', 'Frequency', 'Monetary']
+    return rfm[(rfm['Frequency'] > 0) & (rfm['Monetary'] > 0)]
+
+
+def timed(func, df, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    print(f"{'filas':>10} {'lambda (s)':>12} {'vectorizado (s)':>16} {'speedup':>8}")
+    for n_rows in sizes:
+        df = make_orders(n_rows)
+        t_lambda, expected = timed(rfm_lambda, df, repeat=1 if n_rows >= 1_000_000 else 3)
+        t_vector, result = timed(compute_rfm, df)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{n_rows:>10,} {t_lambda:>12.3f} {t_vector:>16.3f} {t_lambda / t_vector:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
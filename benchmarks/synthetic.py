@@ -0,0 +1,58 @@
+# Generador de exports de clientes sintéticos con el formato real: importes en formato español ("1.234,56"),
+# fechas DD/MM/AAAA, emails repetidos (varias filas por cliente) y una mezcla de suscritos Si/No.
+# Determinista para una semilla dada. Escribe por bloques para poder generar hasta decenas de millones de filas.
+# Uso: python benchmarks/synthetic.py filas salida.csv [--seed N]
+import argparse
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Correo electrónico', 'Fecha de última compra', 'Importe total', 'Total de compras', 'Suscrito a newsletter']
+# Filas por cliente de media, días de historia y proporción de suscritos
+ROWS_PER_CUSTOMER = 4
+HISTORY_DAYS = 2000
+LAST_DATE = pd.Timestamp('2024-12-31')
+SUBSCRIBED_SHARE = 0.7
+BLOCK_ROWS = 1_000_000
+
+
+def _spanish_amounts(cents):
+    # "1.234,56" a partir de céntimos enteros, sin formatear valor a valor
+    euros, cents = np.divmod(cents, 100)
+    thousands, units = np.divmod(euros, 1000)
+    units = pd.Series(units).astype(str)
+    text = np.where(thousands > 0, pd.Series(thousands).astype(str) + '.' + units.str.zfill(3), units)
+    return pd.Series(text) + ',' + pd.Series(cents).astype(str).str.zfill(2)
+
+
+def make_block(n_rows, n_customers, rng, emails, dates):
+    # Los clientes con id bajo compran más (distribución sesgada), como en los exports reales
+    customer = np.minimum((rng.pareto(1.5, n_rows) * n_customers / 10).astype(np.int64), n_customers - 1)
+    return pd.DataFrame({
+        COLUMNS[0]: emails[customer],
+        COLUMNS[1]: dates[rng.integers(0, HISTORY_DAYS, n_rows)],
+        COLUMNS[2]: _spanish_amounts(np.round(rng.gamma(2.0, 40.0, n_rows) * 100).astype(np.int64)).to_numpy(),
+        COLUMNS[3]: rng.integers(1, 10, n_rows),
+        COLUMNS[4]: np.where(rng.random(n_rows) < SUBSCRIBED_SHARE, 'Si', 'No'),
+    })
+
+
+def write_export(path, n_rows, seed=42, block_rows=BLOCK_ROWS):
+    rng = np.random.default_rng(seed)
+    n_customers = max(n_rows // ROWS_PER_CUSTOMER, 1)
+    # Tablas de cadenas que se indexan con enteros: ni fechas ni emails se formatean fila a fila
+    emails = np.array([f'cliente{i}@email.com' for i in range(n_customers)], dtype=object)
+    dates = (LAST_DATE - pd.to_timedelta(np.arange(HISTORY_DAYS), unit='D')).strftime('%d/%m/%Y').to_numpy(dtype=object)
+    for start in range(0, n_rows, block_rows):
+        block = make_block(min(block_rows, n_rows - start), n_customers, rng, emails, dates)
+        block.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    write_export(args.output, args.rows, seed=args.seed)
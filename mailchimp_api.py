@@ -0,0 +1,294 @@
+import hashlib
+import io
+import json
+import random
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# Número de operaciones que se empaquetan en cada petición a /3.0/batches
+BATCH_SIZE = 500
+# Segundos entre consultas del estado de un batch
+POLL_INTERVAL = 2.0
+# Tiempo máximo de espera por batch antes de darlo por perdido
+BATCH_TIMEOUT = 600.0
+
+FINISHED_STATUS = "finished"
+# Hasta este nº de emails se exporta con PUT directos en paralelo: más rápido que enviar un batch y esperar
+# a que Mailchimp lo procese
+DIRECT_MAX = 50
+
+# Conexiones reutilizables por host y peticiones simultáneas para los upserts individuales (Mailchimp admite
+# como mucho 10 conexiones simultáneas por cuenta)
+POOL_SIZE = 10
+MAX_WORKERS = 8
+# Timeout (conexión, lectura) de cada petición HTTP
+REQUEST_TIMEOUT = (5, 30)
+# Reintentos ante 429, errores 5xx o fallos de red
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # Una única sesión por proceso: reutiliza las conexiones TCP/TLS entre llamadas y reruns
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_delay(resp, attempt):
+    # Si Mailchimp indica Retry-After se respeta; si no, backoff exponencial con jitter
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * (0.5 + random.random() / 2)
+
+
+class MailchimpClient:
+    def __init__(self, token=None, api_endpoint=None, session=None, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT):
+        self.token = token
+        self.api_endpoint = api_endpoint
+        self.session = session or get_session()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.metrics = []
+        self._metrics_lock = threading.Lock()
+
+    def url(self, path):
+        return f"{self.api_endpoint}/3.0{path}"
+
+    def request(self, method, url, auth=True, replay=True, **kwargs):
+        # replay=False para peticiones que no se pueden repetir (p. ej. el canje de un código OAuth de un solo
+        # uso): solo se reintenta si no se llegó a conectar, nunca tras un timeout de lectura o un 5xx
+        headers = kwargs.pop("headers", {})
+        if auth and self.token:
+            headers["Authorization"] = f"OAuth {self.token}"
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            resp = None
+            try:
+                resp = self.session.request(method, url, headers=headers, **kwargs)
+                retry = replay and resp.status_code in RETRY_STATUS
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry = replay or isinstance(e, requests.ConnectTimeout)
+                if not retry or attempt >= self.max_retries:
+                    self._record(method, url, None, start, attempt)
+                    raise
+            if not retry or attempt >= self.max_retries:
+                break
+            time.sleep(_retry_delay(resp, attempt))
+            attempt += 1
+        self._record(method, url, resp.status_code, start, attempt)
+        return resp
+
+    def _record(self, method, url, status_code, start, retries):
+        with self._metrics_lock:
+            self.metrics.append({
+                "Método": method,
+                "URL": url.split("?", 1)[0],
+                "Código": status_code,
+                "Reintentos": retries,
+                "Segundos": time.perf_counter() - start,
+            })
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def metrics_frame(self):
+        with self._metrics_lock:
+            return pd.DataFrame(self.metrics, columns=["Método", "URL", "Código", "Reintentos", "Segundos"])
+
+
+def exchange_code(client, token_url, data):
+    # El código solo vale una vez: si la petición llegó a Mailchimp no se repite
+    resp = client.post(token_url, data=data, auth=False, replay=False)
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+def get_api_endpoint(client, metadata_url):
+    resp = client.get(metadata_url)
+    resp.raise_for_status()
+    return resp.json()["api_endpoint"]
+
+
+def get_lists(client):
+    resp = client.get(client.url("/lists"))
+    resp.raise_for_status()
+    return resp.json()["lists"]
+
+
+def subscriber_hash(email):
+    # Mailchimp identifica a cada miembro por el MD5 del email en minúsculas
+    return hashlib.md5(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _member_body(email, status):
+    return {"email_address": email, "status_if_new": status}
+
+
+def build_member_operations(list_id, emails, status="subscribed"):
+    # Un PUT por miembro hace de "upsert": crea el contacto o lo actualiza si ya existe
+    operations = []
+    for email in emails:
+        operations.append({
+            "method": "PUT",
+            "path": f"/lists/{list_id}/members/{subscriber_hash(email)}",
+            "operation_id": email,
+            "body": json.dumps(_member_body(email, status)),
+        })
+    return operations
+
+
+def submit_batch(client, operations):
+    resp = client.post(client.url("/batches"), json={"operations": operations})
+    resp.raise_for_status()
+    return resp.json()
+
+
+def get_batch(client, batch_id):
+    resp = client.get(client.url(f"/batches/{batch_id}"))
+    resp.raise_for_status()
+    return resp.json()
+
+
+def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL, timeout=BATCH_TIMEOUT, on_status=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = get_batch(client, batch_id)
+        if on_status is not None:
+            on_status(batch)
+        if batch.get("status") == FINISHED_STATUS:
+            return batch
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"El batch {batch_id} no terminó en {timeout:.0f} segundos (estado: {batch.get('status')})")
+        time.sleep(poll_interval)
+
+
+def read_batch_results(client, response_body_url):
+    # El resultado de un batch es un .tar.gz con uno o varios JSON de respuestas por operación.
+    # La URL está prefirmada, así que no se envía la cabecera de autorización.
+    resp = client.get(response_body_url, auth=False)
+    resp.raise_for_status()
+    results = []
+    with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r:gz") as archive:
+        for member in archive.getmembers():
+            if not member.isfile() or not member.name.endswith(".json"):
+                continue
+            results.extend(json.load(archive.extractfile(member)))
+    return results
+
+
+def _error_detail(text):
+    try:
+        body = json.loads(text or "{}")
+        return body.get("detail") or body.get("title") or ""
+    except ValueError:
+        return str(text or "")
+
+
+def _result_row(email, status_code, detail=""):
+    return {
+        "Correo electrónico": email,
+        "Código": status_code,
+        "Exportado": 200 <= status_code < 300,
+        "Detalle": detail,
+    }
+
+
+def _batch_result_row(result):
+    status_code = int(result.get("status_code", 0))
+    detail = _error_detail(result.get("response")) if status_code >= 400 else ""
+    return _result_row(result.get("operation_id"), status_code, detail)
+
+
+def upsert_members(client, list_id, emails, status="subscribed", max_workers=MAX_WORKERS, on_progress=None):
+    # Un PUT por email con concurrencia acotada sobre la sesión compartida; para pocos emails (ver export_members)
+    emails = list(dict.fromkeys(emails))
+    total = len(emails)
+
+    def upsert(email):
+        url = client.url(f"/lists/{list_id}/members/{subscriber_hash(email)}")
+        try:
+            resp = client.put(url, json=_member_body(email, status))
+        except requests.RequestException as e:
+            return _result_row(email, 0, str(e))
+        detail = _error_detail(resp.text) if resp.status_code >= 400 else ""
+        return _result_row(email, resp.status_code, detail)
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for row in executor.map(upsert, emails):
+            rows.append(row)
+            if on_progress is not None:
+                on_progress(len(rows), total)
+    return pd.DataFrame(rows, columns=["Correo electrónico", "Código", "Exportado", "Detalle"])
+
+
+def export_members(client, list_id, emails, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL,
+                   timeout=BATCH_TIMEOUT, direct_max=DIRECT_MAX, on_progress=None):
+    # Exporta los emails y devuelve una tabla con el resultado por email: hasta direct_max emails con PUT
+    # directos en paralelo (upsert_members) y, por encima, en batches de Mailchimp
+    emails = list(dict.fromkeys(emails))
+    if len(emails) <= direct_max:
+        return upsert_members(client, list_id, emails, on_progress=on_progress)
+    total = len(emails)
+    rows = []
+    done = 0
+    for chunk in chunked(emails, batch_size):
+        operations = build_member_operations(list_id, chunk)
+        try:
+            batch = submit_batch(client, operations)
+
+            def report(status, offset=done):
+                if on_progress is not None:
+                    on_progress(offset + int(status.get("finished_operations", 0)), total)
+
+            batch = wait_for_batch(client, batch["id"], poll_interval=poll_interval, timeout=timeout, on_status=report)
+            chunk_rows = [_batch_result_row(r) for r in read_batch_results(client, batch["response_body_url"])]
+        except (requests.RequestException, TimeoutError, tarfile.TarError, ValueError, KeyError) as e:
+            chunk_rows = [_result_row(email, 0, str(e)) for email in chunk]
+        # Los emails sin respuesta en el fichero de resultados se marcan como no exportados
+        answered = {row["Correo electrónico"] for row in chunk_rows}
+        for email in chunk:
+            if email not in answered:
+                chunk_rows.append(_result_row(email, 0, "Sin respuesta de Mailchimp"))
+        rows.extend(chunk_rows)
+        done += len(chunk)
+        if on_progress is not None:
+            on_progress(done, total)
+    return pd.DataFrame(rows, columns=["Correo electrónico", "Código", "Exportado", "Detalle"])
+
@@ -0,0 +1,28 @@
+# Núcleo del análisis RFM compartido por la app de Streamlit, el script de consola y test_st.py.
+# No importa Streamlit ni pyrebase para que pueda usarse en procesos batch con arranque rápido.
+from .cache import ResultCache, default_cache, file_digest, result_key
+from .cleaning import clean, malformed_numeric_rows
+from .compact import compact
+from .client import Client, ServiceError
+from .clustering import ENGINE, ENGINES, N_CLUSTERS, cluster, fit_predict, scale, stratified_sample
+from .ingest import CHUNKSIZE, aggregate_chunks, iter_chunks, read_header, sniff
+from .instrument import NULL_SPAN, Tracer, records_frame, span, tracing
+from .exports import FORMATS, ensure_export, write_csv, write_export, write_segments_zip
+from .jobs import DONE, FAILED, STAGES, Job, JobQueue, analyze_file, analyze_state, default_queue
+from .loading import load_file, map_columns, missing_columns
+from .model import (DRIFT_THRESHOLD, MIN_DRIFT_SAMPLE, SegmentationModel, latest_version, load_model, model_versions,
+                    save_model, score_or_refit, segment_with_model)
+from .parsing import (detect_date_format, detect_separators, parse_dates, parse_numeric,
+                      parse_numeric_report)
+from .pipeline import AUTO_K, analyze, segment
+from .profile import QUANTILES, SegmentProfile
+from .quintiles import QUINTILES, quintile_score, quintile_scores, score_segments
+from .schema import DATE, EMAIL, FREQUENCY, MONETARY, NEWSLETTER, REQUIRED_COLUMNS
+from .scoring import aggregate, combine_aggregates, compute_rfm, finalize, fold_partials, reference_date
+from .selection import K_VALUES, TIME_BUDGET, record_selection, select_k
+from .service import SERVICE_URL, Service, default_service, serve
+from .state import STATE_PATH, ingest_delta, load_state, rfm_from_state, save_state, upsert
+from .store import StoreWriter, ensure_store, open_store, rfm_from_store, store_path
+from .validation import BLOCKING, ISSUES, Validator, valid_emails, validate_file
+from .summary import (SEGMENT_ACTIONS, SEGMENT_NAMES, assign_segments, generate_report_text, named_summary,
+                      segment_labels, segment_map, segment_name, summarize)
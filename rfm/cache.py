@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from .shared import BLOCK_SIZE, process_default
+
+# Resultados que se guardan en memoria y tamaño máximo del directorio en disco
+MEMORY_ENTRIES = 16
+DISK_BYTES = 512 * 1024 * 1024
+CACHE_DIR = os.environ.get('RFM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'rfm_cache'))
+
+_code_version = None
+
+
+def code_version():
+    # Hash del código del paquete: cualquier cambio en el cálculo invalida los resultados guardados
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package_dir)):
+            if name.endswith('.py'):
+                with open(os.path.join(package_dir, name), 'rb') as f:
+                    digest.update(name.encode('utf-8'))
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def file_digest(source):
+    # SHA-256 del contenido; acepta una ruta o un fichero abierto/subido (se rebobina al terminar)
+    digest = hashlib.sha256()
+    if hasattr(source, 'read'):
+        source.seek(0)
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            digest.update(block)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def result_key(digest, mapping=None, n_clusters=None, **params):
+    payload = {
+        'digest': digest,
+        'mapping': sorted((mapping or {}).items()),
+        'n_clusters': n_clusters,
+        'params': sorted(params.items()),
+        'version': code_version(),
+    }
+    return hashlib.sha256(json.dumps(payload, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    # Caché de resultados (cluster_analysis, rfm) direccionada por contenido, con dos niveles:
+    # LRU en memoria del proceso y Parquet en disco compartido entre procesos, con expulsión por tamaño.
+    # Con directory=None es solo el LRU en memoria y guarda cualquier valor (el servicio la usa así para
+    # validaciones e informes)
+
+    def __init__(self, directory=CACHE_DIR, max_entries=MEMORY_ENTRIES, max_bytes=DISK_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        result = self._read_disk(key)
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        self._remember(key, result)
+        if self.directory and self.max_bytes > 0:
+            self._write_disk(key, result)
+            self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        path = self._path(key) if self.directory else None
+        if path is None or not os.path.isdir(path):
+            return None
+        try:
+            cluster_analysis = pd.read_parquet(os.path.join(path, 'cluster_analysis.parquet'))
+            rfm = pd.read_parquet(os.path.join(path, 'rfm.parquet'))
+        except (OSError, ValueError):
+            return None
+        # La fecha de modificación marca el último uso para la expulsión LRU en disco
+        os.utime(path)
+        return cluster_analysis, rfm
+
+    def _write_disk(self, key, result):
+        cluster_analysis, rfm = result
+        os.makedirs(self.directory, exist_ok=True)
+        # Se escribe en un directorio temporal y se renombra: otro proceso nunca ve una entrada a medias
+        tmp = os.path.join(self.directory, f'.{key}.{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            cluster_analysis.to_parquet(os.path.join(tmp, 'cluster_analysis.parquet'))
+            rfm.to_parquet(os.path.join(tmp, 'rfm.parquet'))
+            os.replace(tmp, self._path(key))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+# Instancia compartida por todo el proceso (todas las sesiones de Streamlit)
+default_cache = process_default(ResultCache)
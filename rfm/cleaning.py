@@ -0,0 +1,26 @@
+import pandas as pd
+
+from .parsing import parse_dates, parse_numeric, parse_numeric_report
+from .schema import DATE, NEWSLETTER, NUMERIC_COLUMNS, SUBSCRIBED
+
+
+def malformed_numeric_rows(df, columns=NUMERIC_COLUMNS):
+    # Filas con importes o nº de compras que no se pueden interpretar como número
+    mask = pd.Series(False, index=df.index)
+    for col in columns:
+        mask |= parse_numeric_report(df[col])[1]
+    return df[mask]
+
+
+def clean(df, subscribed_only=True, date_format=None):
+    # Filtra suscritos, convierte fechas (formato detectado o date_format) y normaliza las columnas numéricas.
+    # Los importes mal formados quedan como NaN y no suman en el RFM (ver malformed_numeric_rows)
+    if subscribed_only and NEWSLETTER in df.columns:
+        df = df[df[NEWSLETTER] == SUBSCRIBED].copy()
+    else:
+        df = df.copy()
+    df[DATE] = parse_dates(df[DATE], date_format)
+    df = df.dropna(subset=[DATE])
+    for col in NUMERIC_COLUMNS:
+        df[col] = parse_numeric(df[col])
+    return df
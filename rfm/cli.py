@@ -0,0 +1,209 @@
+# Análisis RFM por lotes sin interfaz: muchos ficheros (o directorios) en un pool de procesos.
+# Uso: python -m rfm ficheros_o_directorios... [-o salida] [-j procesos] [-k nº de segmentos|auto] [--engine motor] [--refit]
+#      [--time-budget segundos]
+# Los clientes se asignan con el último modelo de segmentación guardado (ver model.py), así que los ids y nombres
+# de segmento no cambian entre ejecuciones; --refit fuerza un ajuste nuevo sobre cada fichero.
+# Por cada fichero escribe en salida/<nombre>-<hash de la ruta>/ el resumen de segmentos, el informe, un CSV por segmento
+# y timings.json; en salida/summary.json deja el estado y los tiempos de todos los ficheros.
+# Flujo incremental: python -m rfm ingest deltas... [--state estado.parquet] fusiona los exports diarios en el
+# estado acumulado (ver state.py) y python -m rfm --state estado.parquet [-o salida] analiza ese estado.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .clustering import ENGINE, ENGINES, N_CLUSTERS
+from .exports import SEGMENT_COLUMNS, slug, write_csv, write_export
+from .jobs import FAILED, Job, analyze_file, analyze_state
+from .pipeline import AUTO_K
+from .selection import TIME_BUDGET
+from .state import STATE_PATH, ingest_delta
+from .summary import named_summary
+
+EXTENSIONS = ('.csv', '.xlsx')
+OUTPUT_DIR = 'rfm_output'
+
+
+def expand_inputs(paths):
+    # Los directorios se sustituyen por sus ficheros CSV/Excel (sin recursión); se conserva el orden
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(EXTENSIONS)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def output_dir_for(path, output_dir=OUTPUT_DIR):
+    # Nombre legible del fichero más un hash corto de su ruta absoluta: tienda_a/export.csv y
+    # tienda_b/export.csv no comparten directorio aunque se procesen a la vez
+    path_hash = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(output_dir, f'{slug(os.path.splitext(os.path.basename(path))[0])}-{path_hash}')
+
+
+def write_outputs(directory, cluster_analysis, rfm_data):
+    segments_dir = os.path.join(directory, 'segmentos')
+    os.makedirs(segments_dir, exist_ok=True)
+    named_summary(cluster_analysis).to_csv(os.path.join(directory, 'resumen.csv'))
+    with open(os.path.join(directory, 'informe.md'), 'wb') as f:
+        write_export('md', cluster_analysis, rfm_data, f)
+    for name, positions in rfm_data.groupby('Segmento', sort=False).indices.items():
+        with open(os.path.join(segments_dir, f'{slug(name)}.csv'), 'wb') as f:
+            write_csv(rfm_data, f, SEGMENT_COLUMNS, positions)
+
+
+def process_file(path, output_dir=OUTPUT_DIR, n_clusters=N_CLUSTERS, engine=ENGINE, trace=False,
+                 analyze=analyze_file, refit=False, time_budget=TIME_BUDGET):
+    # Se ejecuta en un proceso del pool; nunca lanza excepciones, los errores van en el resultado.
+    # Usa el mismo Job por etapas que la app, así los tiempos de cada etapa coinciden en ambos.
+    # Con trace=True el resultado incluye los spans (tiempo, filas y picos de memoria) en 'spans'.
+    # Con analyze=jobs.analyze_state, path es el estado acumulado en lugar de un export
+    directory = output_dir_for(path, output_dir)
+    start = time.perf_counter()
+    report = {}
+    job = Job(path, trace=trace).run(analyze, path, n_clusters=n_clusters, engine=engine, report=report, refit=refit,
+                                     time_budget=time_budget)
+    result = {'file': path, 'status': 'ok', 'timings': job.timings}
+    if job.tracer is not None:
+        result['spans'] = job.tracer.records
+    if job.status == FAILED:
+        result.update(status='error', error=job.error)
+    elif job.result[0] is None:
+        result['status'] = 'empty'
+    else:
+        cluster_analysis, rfm_data = job.result
+        try:
+            stage = time.perf_counter()
+            write_outputs(directory, cluster_analysis, rfm_data)
+            job.timings['write'] = time.perf_counter() - stage
+            # Al asignar con el modelo guardado no hay inercia, pero sí versión y deriva
+            result.update(customers=len(rfm_data), n_clusters=report['n_clusters'], engine=report['engine'],
+                          inertia=report.get('inertia'), model_version=report.get('model_version'),
+                          refit=report.get('refit'), drift=report.get('drift'), k_fallback=report.get('k_fallback'),
+                          segments=rfm_data['Segmento'].value_counts().to_dict(), output=directory)
+        except Exception as e:
+            result.update(status='error', error=f'{type(e).__name__}: {e}')
+    job.timings['total'] = time.perf_counter() - start
+    if os.path.isdir(directory):
+        with open(os.path.join(directory, 'timings.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+def run(files, output_dir=OUTPUT_DIR, workers=None, n_clusters=N_CLUSTERS, engine=ENGINE, trace=False,
+        on_result=None, refit=False, time_budget=TIME_BUDGET):
+    # Procesa los ficheros en paralelo y devuelve los resultados en el orden de entrada
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, path, output_dir, n_clusters, engine, trace, refit=refit,
+                                   time_budget=time_budget): path
+                   for path in files}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result is not None:
+                on_result(result)
+    return [results[path] for path in files]
+
+
+def _clusters(value):
+    return value if value == AUTO_K else int(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rfm', description="Análisis RFM por lotes de ficheros de clientes.",
+                                     epilog="Para fusionar exports diarios en el estado acumulado: python -m rfm ingest -h")
+    parser.add_argument('inputs', nargs='*', help="Ficheros CSV/Excel o directorios que los contienen")
+    parser.add_argument('--state', help="Analiza el estado acumulado con 'python -m rfm ingest' (Parquet) en lugar de ficheros")
+    parser.add_argument('-o', '--output', default=OUTPUT_DIR, help="Directorio de salida (por defecto %(default)s)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Procesos en paralelo (por defecto, nº de CPUs)")
+    parser.add_argument('-k', '--clusters', type=_clusters, default=N_CLUSTERS,
+                        help=f"Número de segmentos o '{AUTO_K}' para elegirlo automáticamente (por defecto %(default)s)")
+    parser.add_argument('--engine', choices=list(ENGINES), default=ENGINE, help="Motor de clustering (por defecto %(default)s)")
+    parser.add_argument('--time-budget', type=float, default=TIME_BUDGET,
+                        help=f"Segundos para elegir el nº de segmentos con -k {AUTO_K} (por defecto %(default)s, RFM_TIME_BUDGET)")
+    parser.add_argument('--refit', action='store_true',
+                        help="Reajusta el modelo de segmentación en lugar de asignar con el último guardado")
+    parser.add_argument('--trace', action='store_true',
+                        help="Añade a los JSON los spans de cada etapa: tiempo, filas y picos de memoria (más lento)")
+    args = parser.parse_args(argv)
+    if bool(args.inputs) == bool(args.state):
+        parser.error("indica ficheros o directorios, o bien --state, pero no ambos")
+    return args
+
+
+def parse_ingest_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rfm ingest',
+                                     description="Fusiona exports de nuevas transacciones en el estado RFM acumulado. "
+                                                 "Cada fichero se aplica una sola vez aunque se vuelva a pasar.")
+    parser.add_argument('deltas', nargs='+', help="Ficheros CSV/Excel con las transacciones nuevas, en orden")
+    parser.add_argument('--state', default=STATE_PATH, help="Parquet del estado acumulado (por defecto %(default)s)")
+    return parser.parse_args(argv)
+
+
+def ingest_main(argv=None):
+    args = parse_ingest_args(argv)
+    failed = 0
+    for path in args.deltas:
+        try:
+            report = ingest_delta(path, args.state)
+        except Exception as e:
+            print(f"ERROR {path}: {type(e).__name__}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        if report['applied']:
+            print(f"aplicado {path}: {report['new_customers']} clientes nuevos, {report['updated_customers']} "
+                  f"actualizados, {report['customers']} en total", file=sys.stderr)
+        else:
+            print(f"ya aplicado {path}: sin cambios ({report['customers']} clientes)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ['ingest']:
+        return ingest_main(argv[1:])
+    args = parse_args(argv)
+    if args.state:
+        files = [args.state]
+    else:
+        files = expand_inputs(args.inputs)
+    if not files:
+        print("No se encontraron ficheros CSV o Excel en las rutas indicadas.", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+
+    def report(result):
+        if result['status'] == 'error':
+            print(f"ERROR {result['file']}: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{result['status']:>5} {result['file']} ({result['timings']['total']:.2f} s)", file=sys.stderr)
+        if result.get('k_fallback'):
+            print(f"AVISO {result['file']}: ningún k terminó en {args.time_budget:g} s; se usaron "
+                  f"{result['n_clusters']} segmentos por defecto (sube --time-budget)", file=sys.stderr)
+
+    if args.state:
+        # Un solo análisis, en este proceso
+        results = [process_file(args.state, args.output, args.clusters, args.engine, args.trace, analyze=analyze_state,
+                                refit=args.refit, time_budget=args.time_budget)]
+        report(results[0])
+    else:
+        results = run(files, args.output, workers=args.workers, n_clusters=args.clusters, engine=args.engine,
+                      trace=args.trace, on_result=report, refit=args.refit, time_budget=args.time_budget)
+    summary = {
+        'files': len(results),
+        'failed': sum(result['status'] == 'error' for result in results),
+        'seconds': time.perf_counter() - start,
+        'results': results,
+    }
+    with open(os.path.join(args.output, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"{summary['files']} ficheros procesados, {summary['failed']} con errores, "
+          f"{summary['seconds']:.2f} s. Resumen en {os.path.join(args.output, 'summary.json')}", file=sys.stderr)
+    return 1 if summary['failed'] else 0
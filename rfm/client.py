@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import shutil
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+
+from .compact import compact
+from .exports import EXPORT_BYTES, EXPORT_DIR, FORMATS, export_path
+from .service import frame_from_json, report_from_dict
+from .shared import BLOCK_SIZE, AtomicPath
+from .store import evict
+from .validation import Validator
+
+# Timeout de cada petición al servicio; la subida de un fichero grande incluye su validación
+TIMEOUT = 600
+
+
+class ServiceError(Exception):
+    pass
+
+
+class Client:
+    # Cliente HTTP de service.py con los mismos métodos y valores de retorno que Service, para que la app
+    # funcione igual con el servicio compartido o con un Service dentro de su propio proceso.
+    # Las descargas se guardan en export_dir y solo se piden una vez por resultado y formato
+
+    def __init__(self, url, export_dir=EXPORT_DIR, timeout=TIMEOUT):
+        self.url = url.rstrip('/')
+        self.export_dir = export_dir
+        self.timeout = timeout
+
+    def _open(self, method, path, data=None, headers=None):
+        request = urllib.request.Request(f'{self.url}{path}', data=data, method=method, headers=headers or {})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            try:
+                message = json.loads(e.read())['error']
+            except (ValueError, KeyError):
+                message = str(e)
+            raise ServiceError(message) from None
+
+    def _json(self, method, path, payload=None, **kwargs):
+        if payload is not None:
+            kwargs.update(data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
+        response = self._open(method, path, **kwargs)
+        if response is None:
+            return None
+        with response:
+            return json.loads(response.read())
+
+    def upload(self, source, name):
+        # El fichero se envía tal cual; urllib lo lee por bloques sin cargarlo entero
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        upload = self._json('POST', f'/uploads?{urllib.parse.urlencode({"name": name})}', data=source,
+                            headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(size)})
+        source.seek(0)
+        return {**upload, 'issues': Validator.from_dict(upload['issues'])}
+
+    def analyze(self, digest, name, mapping, n_clusters, engine, trace=False, refit=False):
+        return self._json('POST', '/analyses', {'digest': digest, 'name': name, 'mapping': mapping,
+                                                'n_clusters': n_clusters, 'engine': engine, 'trace': trace,
+                                                'refit': refit})
+
+    def job_status(self, job_id):
+        return self._json('GET', f'/jobs/{job_id}')
+
+    def result(self, key):
+        result = self._json('GET', f'/results/{key}')
+        if result is None:
+            return None
+        response = self._open('GET', f'/results/{key}/customers')
+        if response is None:
+            return None
+        with response:
+            rfm_data = pd.read_parquet(io.BytesIO(response.read()))
+        return frame_from_json(result['cluster_analysis']), compact(rfm_data)
+
+    def report(self, key):
+        result = self._json('GET', f'/results/{key}')
+        return report_from_dict(result['report']) if result is not None else {}
+
+    def export(self, key, fmt):
+        path = export_path(key, fmt, self.export_dir)
+        if os.path.exists(path):
+            return path
+        response = self._open('GET', f'/results/{key}/exports/{fmt}')
+        if response is None:
+            raise KeyError(key)
+        os.makedirs(self.export_dir, exist_ok=True)
+        with response, AtomicPath(path) as tmp, open(tmp, 'wb') as f:
+            shutil.copyfileobj(response, f, BLOCK_SIZE)
+        evict(self.export_dir, EXPORT_BYTES, suffix=tuple(f'.{fmt}' for fmt in FORMATS))
+        return path
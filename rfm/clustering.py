@@ -0,0 +1,123 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from .quintiles import QUINTILES
+from .schema import RFM_COLUMNS
+
+N_CLUSTERS = 5
+RANDOM_STATE = 42
+N_INIT = 10
+
+# Motores disponibles: KMeans exacto, MiniBatchKMeans y KMeans ajustado sobre una muestra estratificada
+# y aplicado después por trozos a todos los clientes. "auto" elige según el nº de clientes.
+# "quintiles" no agrupa: puntúa R/F/M por quintiles y asigna segmentos con reglas fijas (ver quintiles.py)
+ENGINES = {
+    'auto': "Automático",
+    'kmeans': "KMeans exacto",
+    'minibatch': "MiniBatchKMeans",
+    'sampled': "KMeans sobre muestra estratificada",
+    QUINTILES: "Puntuación RFM por quintiles",
+}
+ENGINE = 'auto'
+# A partir de este nº de clientes "auto" deja de usar KMeans exacto
+AUTO_THRESHOLD = 200_000
+SAMPLE_SIZE = 100_000
+PREDICT_CHUNK = 500_000
+MINIBATCH_SIZE = 4096
+# Cuantiles por variable para estratificar la muestra (4 x 4 x 4 estratos)
+STRATA_BINS = 4
+
+
+def scale(rfm):
+    # sklearn se importa aquí para que cargar el paquete no pague su coste de arranque
+    from sklearn.preprocessing import StandardScaler
+
+    return StandardScaler().fit_transform(np.log1p(rfm[RFM_COLUMNS]))
+
+
+def stratified_sample(features, sample_size=SAMPLE_SIZE, bins=STRATA_BINS, random_state=RANDOM_STATE):
+    # Índices de una muestra proporcional por estrato (cuantiles de cada variable), con al menos uno por estrato
+    n = len(features)
+    if n <= sample_size:
+        return np.arange(n)
+    strata = np.zeros(n, dtype=np.int64)
+    for column in range(features.shape[1]):
+        codes = pd.qcut(features[:, column], bins, labels=False, duplicates='drop')
+        strata = strata * bins + np.asarray(codes, dtype=np.int64)
+    order = np.random.default_rng(random_state).permutation(n)
+    shuffled = pd.Series(strata[order])
+    position = shuffled.groupby(shuffled).cumcount().to_numpy()
+    sizes = shuffled.map(shuffled.value_counts()).to_numpy()
+    quota = np.maximum(np.ceil(sizes * sample_size / n), 1)
+    return np.sort(order[position < quota])
+
+
+def _predict_in_chunks(model, features, chunk_size=PREDICT_CHUNK):
+    # Asigna clusters por trozos para acotar la memoria de las distancias y calcula la inercia total
+    labels = np.empty(len(features), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(features), chunk_size):
+        distances = model.transform(features[start:start + chunk_size])
+        labels[start:start + chunk_size] = distances.argmin(axis=1)
+        inertia += float((distances.min(axis=1) ** 2).sum())
+    return labels, inertia
+
+
+def resolve_engine(engine, n_customers):
+    if engine == 'auto':
+        return 'kmeans' if n_customers <= AUTO_THRESHOLD else 'sampled'
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de clustering desconocido: {engine}. Opciones: {', '.join(ENGINES)}")
+    if engine == QUINTILES:
+        raise ValueError("El motor por quintiles no ajusta centroides; usa pipeline.segment()")
+    return engine
+
+
+def fit_predict(features, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init=N_INIT, engine=ENGINE,
+                sample_size=SAMPLE_SIZE):
+    # Devuelve (etiquetas, modelo, informe) con tiempos de ajuste y asignación e inercia sobre todos los clientes
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    engine = resolve_engine(engine, len(features))
+    start = time.perf_counter()
+    if engine == 'kmeans':
+        model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init)
+        labels = model.fit_predict(features).astype(np.int32)
+        fit_seconds, predict_seconds = time.perf_counter() - start, 0.0
+        inertia, n_fit = float(model.inertia_), len(features)
+    else:
+        if engine == 'minibatch':
+            model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init,
+                                    batch_size=MINIBATCH_SIZE, compute_labels=False)
+            model.fit(features)
+            n_fit = len(features)
+        else:
+            sample = stratified_sample(features, sample_size, random_state=random_state)
+            model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init)
+            model.fit(features[sample])
+            n_fit = len(sample)
+        fit_seconds = time.perf_counter() - start
+        labels, inertia = _predict_in_chunks(model, features)
+        predict_seconds = time.perf_counter() - start - fit_seconds
+    report = {
+        'engine': engine,
+        'n_clusters': n_clusters,
+        'n_customers': len(features),
+        'n_fit': n_fit,
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+        'inertia': inertia,
+    }
+    return labels, model, report
+
+
+def cluster(rfm, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init=N_INIT, engine=ENGINE,
+            sample_size=SAMPLE_SIZE):
+    # Devuelve (rfm con la columna Cluster, informe del motor usado)
+    labels, _, report = fit_predict(scale(rfm), n_clusters=n_clusters, random_state=random_state, n_init=n_init,
+                                    engine=engine, sample_size=sample_size)
+    rfm = rfm.copy()
+    rfm['Cluster'] = labels
+    return rfm, report
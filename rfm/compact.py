@@ -0,0 +1,22 @@
+import pandas as pd
+
+from .schema import EMAIL
+
+
+def compact(rfm):
+    # Versión compacta de la tabla por cliente para guardarla en sesión y en la caché: emails como cadenas
+    # Arrow (un buffer contiguo en lugar de un objeto Python por email), R/F/M con el tipo numérico más
+    # pequeño que las representa (float32 para F y M), Cluster int8 y Segmento categórico.
+    # Exportar a CSV da el mismo texto que con la tabla original
+    columns = {
+        'Recency': pd.to_numeric(rfm['Recency'], downcast='integer'),
+        'Frequency': rfm['Frequency'].astype('float32'),
+        'Monetary': rfm['Monetary'].astype('float32'),
+    }
+    if 'Cluster' in rfm:
+        columns['Cluster'] = pd.to_numeric(rfm['Cluster'], downcast='integer')
+    if 'Segmento' in rfm:
+        columns['Segmento'] = rfm['Segmento'].astype('category')
+    index = pd.Index(rfm.index, dtype='string[pyarrow]', name=EMAIL)
+    return pd.DataFrame({name: values.to_numpy() if name != 'Segmento' else values.array
+                         for name, values in columns.items()}, index=index)
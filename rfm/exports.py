@@ -0,0 +1,84 @@
+import os
+import tempfile
+import zipfile
+
+from .schema import EMAIL, RFM_COLUMNS
+from .shared import AtomicPath
+from .store import evict
+from .summary import generate_report_text
+
+# Ficheros de descarga generados una vez por resultado (clave de la caché de análisis) y formato
+EXPORT_DIR = os.environ.get('RFM_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'rfm_exports'))
+EXPORT_BYTES = 1024 * 1024 * 1024
+# Filas que se serializan de cada vez: la memoria no crece con el tamaño del segmento
+CHUNK_ROWS = 100_000
+
+# Formato: (texto del botón, nombre del fichero, tipo MIME)
+FORMATS = {
+    'csv': ("📧 Descargar CSV con Correos por Segmento", "correos_por_segmento.csv", "text/csv"),
+    'zip': ("🗂️ Descargar un CSV por segmento (zip)", "segmentos.zip", "application/zip"),
+    'parquet': ("🧱 Descargar tabla RFM (Parquet)", "clientes_rfm.parquet", "application/octet-stream"),
+    'md': ("📥 Descargar Informe de Análisis", "informe_segmentacion_rfm.md", "text/markdown"),
+}
+EMAIL_COLUMNS = [EMAIL, 'Segmento']
+SEGMENT_COLUMNS = [EMAIL] + RFM_COLUMNS
+
+
+def slug(text):
+    return ''.join(ch if ch.isalnum() else '_' for ch in text.lower()).strip('_')
+
+
+def write_csv(rfm, f, columns=EMAIL_COLUMNS, positions=None, chunk_rows=CHUNK_ROWS):
+    # Escribe rfm (o solo las filas en positions) como CSV UTF-8 en el fichero binario f, por trozos
+    if positions is None:
+        positions = range(len(rfm))
+    header = True
+    for start in range(0, len(positions), chunk_rows):
+        chunk = rfm.iloc[positions[start:start + chunk_rows]].reset_index()[columns]
+        f.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+    if header:
+        f.write((','.join(columns) + '\n').encode('utf-8'))
+
+
+def write_segments_zip(rfm, f, chunk_rows=CHUNK_ROWS):
+    # Un CSV por segmento dentro de un zip; cada CSV se escribe en streaming dentro del zip
+    groups = rfm.groupby('Segmento', observed=True, sort=False).indices
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, positions in groups.items():
+            with archive.open(f'{slug(name)}.csv', 'w', force_zip64=True) as member:
+                write_csv(rfm, member, SEGMENT_COLUMNS, positions, chunk_rows)
+
+
+def write_parquet(rfm, f):
+    rfm.reset_index().to_parquet(f, index=False)
+
+
+def write_export(fmt, cluster_analysis, rfm, f):
+    if fmt == 'csv':
+        write_csv(rfm, f)
+    elif fmt == 'zip':
+        write_segments_zip(rfm, f)
+    elif fmt == 'parquet':
+        write_parquet(rfm, f)
+    elif fmt == 'md':
+        f.write(generate_report_text(cluster_analysis).encode('utf-8'))
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {fmt}. Opciones: {', '.join(FORMATS)}")
+
+
+def export_path(key, fmt, directory=EXPORT_DIR):
+    return os.path.join(directory, f'{key}.{fmt}')
+
+
+def ensure_export(key, fmt, cluster_analysis, rfm, directory=EXPORT_DIR):
+    # Genera el fichero la primera vez que se pide y después lo reutiliza (también entre sesiones)
+    path = export_path(key, fmt, directory)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(directory, exist_ok=True)
+    with AtomicPath(path) as tmp, open(tmp, 'wb') as f:
+        write_export(fmt, cluster_analysis, rfm, f)
+    evict(directory, EXPORT_BYTES, suffix=tuple(f'.{fmt}' for fmt in FORMATS))
+    return path
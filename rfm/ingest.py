@@ -0,0 +1,92 @@
+import pandas as pd
+
+from .cleaning import clean
+from .loading import map_columns
+from .parsing import SAMPLE_SIZE, detect_date_format, detect_separators
+from .schema import DATE, EMAIL, MONETARY, NEWSLETTER
+from .scoring import aggregate, combine_aggregates, fold_partials
+
+# Filas por trozo al leer CSV: acota la memoria pico independientemente del tamaño del fichero
+CHUNKSIZE = 250_000
+
+
+def _name(source, name=None):
+    return name or getattr(source, 'name', None) or str(source)
+
+
+def _rewind(source):
+    # Los ficheros subidos se leen varias veces (cabecera, validación, análisis)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def read_header(source, name=None):
+    _rewind(source)
+    if _name(source, name).endswith('.xlsx'):
+        columns = pd.read_excel(source, nrows=0).columns.tolist()
+    else:
+        columns = pd.read_csv(source, nrows=0).columns.tolist()
+    _rewind(source)
+    return columns
+
+
+def _dtypes(usecols, mapping=None):
+    # Email y fecha como texto, la newsletter como categoría (pocos valores distintos); los importes
+    # los convierte el propio lector con los separadores detectados (ver csv_separators)
+    mapping = mapping or {}
+    dtypes = {
+        mapping.get(EMAIL, EMAIL): str,
+        mapping.get(DATE, DATE): str,
+        mapping.get(NEWSLETTER, NEWSLETTER): 'category',
+    }
+    return {col: dtype for col, dtype in dtypes.items() if col in usecols}
+
+
+def sniff(source, mapping=None, sample_size=SAMPLE_SIZE, name=None):
+    # Detecta una sola vez, sobre una muestra de importe y fecha, los separadores numéricos y el formato
+    # de fecha del fichero; así el lector C convierte los importes directamente y las fechas se parsean
+    # con un formato explícito en lugar de inferirlo elemento a elemento
+    mapping = mapping or {}
+    monetary, date = mapping.get(MONETARY, MONETARY), mapping.get(DATE, DATE)
+    usecols = list(dict.fromkeys([monetary, date]))
+    _rewind(source)
+    try:
+        if _name(source, name).endswith('.xlsx'):
+            sample = pd.read_excel(source, usecols=usecols, nrows=sample_size)
+        else:
+            sample = pd.read_csv(source, usecols=usecols, dtype=str, nrows=sample_size)
+    except ValueError:
+        return {}
+    finally:
+        _rewind(source)
+    decimal, thousands = detect_separators(sample[monetary], sample_size)
+    return {'decimal': decimal, 'thousands': thousands, 'date_format': detect_date_format(sample[date], sample_size)}
+
+
+def iter_chunks(source, usecols, chunksize=CHUNKSIZE, name=None, mapping=None, options=None):
+    # Lee solo las columnas indicadas; los CSV por trozos y los Excel de una vez (openpyxl no trocea)
+    usecols = list(dict.fromkeys(usecols))
+    if _name(source, name).endswith('.xlsx'):
+        _rewind(source)
+        yield pd.read_excel(source, usecols=usecols)
+        return
+    if options is None:
+        options = sniff(source, mapping, name=name)
+    separators = {key: options[key] for key in ('decimal', 'thousands') if key in options}
+    _rewind(source)
+    with pd.read_csv(source, usecols=usecols, dtype=_dtypes(usecols, mapping), chunksize=chunksize,
+                     **separators) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def aggregate_chunks(chunks, mapping=None, subscribed_only=True, date_format=None):
+    # Limpia y agrega cada trozo; los parciales se fusionan por tandas (ver scoring.fold_partials)
+    def partials():
+        for chunk in chunks:
+            if mapping is not None:
+                chunk = map_columns(chunk, mapping)
+            yield aggregate(clean(chunk, subscribed_only, date_format=date_format))
+
+    return fold_partials(partials(), combine_aggregates)
+
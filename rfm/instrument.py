@@ -0,0 +1,128 @@
+import contextvars
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Instrumentación ligera por etapas: cada span registra tiempo, filas de entrada y salida y picos de memoria
+# (RSS máximo del proceso y, opcionalmente, pico de tracemalloc). Sin un tracing() activo, span() no hace nada
+_current = contextvars.ContextVar('rfm_tracer', default=None)
+
+
+def _rss_peak_mb():
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux (en bytes en macOS, donde el valor sale 1024 veces mayor)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _NullSpan:
+    # Span de los tramos sin tracing: ignora las asignaciones (también "+=") para que el código
+    # instrumentado no cambie
+    enabled = False
+    rows_in = rows_out = 0
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    enabled = True
+
+    def __init__(self, name, depth, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.child_peak = 0
+
+
+class Tracer:
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+
+    @contextmanager
+    def span(self, name, rows_in=None):
+        parent = self._stack[-1] if self._stack else None
+        current = Span(name, len(self._stack), rows_in)
+        if self.memory:
+            # El pico de tracemalloc es global: se guarda el del padre antes de reiniciarlo para este tramo
+            if parent is not None:
+                parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(current)
+        # Los registros se guardan en orden de apertura; se completan al cerrar el tramo
+        record = {'name': name, 'depth': current.depth}
+        self.records.append(record)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['rows_in'] = current.rows_in
+            record['rows_out'] = current.rows_out
+            record['rss_peak_mb'] = _rss_peak_mb()
+            if self.memory:
+                peak = max(tracemalloc.get_traced_memory()[1], current.child_peak)
+                record['py_peak_mb'] = peak / 1024 ** 2
+                if parent is not None:
+                    parent.child_peak = max(parent.child_peak, peak)
+            self._stack.pop()
+
+    def frame(self):
+        return records_frame(self.records)
+
+    def to_json(self):
+        return json.dumps(self.records, ensure_ascii=False)
+
+
+def records_frame(records):
+    # Tabla de spans con el nombre sangrado según su anidamiento
+    import pandas as pd
+
+    frame = pd.DataFrame(records)
+    if not frame.empty:
+        frame['name'] = ['  ' * depth + name for depth, name in zip(frame.pop('depth'), frame['name'])]
+    return frame
+
+
+@contextmanager
+def tracing(enabled=True, memory=False):
+    # Activa un Tracer para este contexto (hilo o tarea); los trabajos de jobs.py activan el suyo con trace=True.
+    # Con enabled=False devuelve None y los spans siguen sin hacer nada. Con memory=True se usa tracemalloc,
+    # que ralentiza bastante el código instrumentado
+    if not enabled:
+        yield None
+        return
+    tracer = Tracer(memory=memory)
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+        if started:
+            tracemalloc.stop()
+
+
+@contextmanager
+def span(name, rows_in=None):
+    tracer = _current.get()
+    if tracer is None:
+        yield NULL_SPAN
+        return
+    with tracer.span(name, rows_in) as current:
+        yield current
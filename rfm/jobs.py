@@ -0,0 +1,174 @@
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import file_digest
+from .clustering import ENGINE, N_CLUSTERS
+from .instrument import span, tracing
+from .model import MODEL_DIR, segment_with_model
+from .selection import TIME_BUDGET
+from .shared import process_default
+from .state import STATE_PATH, rfm_from_state
+from .store import convert, rfm_from_store, store_path
+
+# Etapas del análisis en orden, con su texto para la interfaz
+STAGES = {
+    'load': "Cargando el fichero",
+    'clean': "Limpiando y tipando los datos",
+    'aggregate': "Calculando Recency, Frequency y Monetary",
+    'cluster': "Agrupando clientes",
+    'summarize': "Resumiendo los segmentos",
+}
+# Análisis simultáneos por proceso: el clustering ya usa varios hilos (OpenMP/BLAS) por análisis
+MAX_WORKERS = 2
+# Segundos que se conservan los trabajos terminados para que la interfaz recoja su resultado
+JOB_TTL = 3600
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'error'
+
+
+class Job:
+    # Estado de un trabajo: etapa actual, progreso (etapas completadas / total), tiempos por etapa,
+    # resultado o error. Lo actualiza el hilo que ejecuta el trabajo y lo consulta quien hace polling.
+    # Con trace=True el trabajo se ejecuta con instrumentación y deja los spans en self.tracer
+
+    def __init__(self, job_id, stages=STAGES, trace=False):
+        self.id = job_id
+        self.stages = list(stages)
+        self.trace = trace
+        self.tracer = None
+        self.status = PENDING
+        self.stage = None
+        self.timings = {}
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created = time.time()
+        self.finished = None
+        self._stage_start = None
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage):
+        with self._lock:
+            now = time.perf_counter()
+            if self.stage is not None:
+                self.timings[self.stage] = now - self._stage_start
+            self.status = RUNNING
+            self.stage, self._stage_start = stage, now
+
+    def finish(self, result=None, error=None):
+        with self._lock:
+            if self.stage is not None:
+                self.timings[self.stage] = time.perf_counter() - self._stage_start
+            self.result, self.error = result, error
+            self.status = FAILED if error is not None else DONE
+            self.finished = time.time()
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def label(self):
+        return STAGES.get(self.stage, self.stage) if self.stage else "En cola"
+
+    def run(self, fn, *args, **kwargs):
+        # fn recibe on_stage=self.set_stage para informar del avance
+        try:
+            # tracemalloc es global al proceso: con varios trabajos instrumentados a la vez los picos son orientativos
+            with tracing(self.trace, memory=True) as tracer:
+                self.tracer = tracer
+                result = fn(*args, on_stage=self.set_stage, **kwargs)
+            self.finish(result=result)
+        except Exception as e:
+            self.finish(error=f'{type(e).__name__}: {e}')
+            self.traceback = traceback.format_exc()
+        return self
+
+
+class JobQueue:
+    # Cola de trabajos en un pool de hilos: pandas, pyarrow y sklearn liberan el GIL en las partes pesadas,
+    # y los hilos pueden leer ficheros subidos y resultados sin serializarlos entre procesos
+
+    def __init__(self, max_workers=MAX_WORKERS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rfm-job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, stages=STAGES, trace=False, **kwargs):
+        with self._lock:
+            self._prune()
+            job = Job(f'{os.getpid()}-{next(self._ids)}', stages, trace=trace)
+            self._jobs[job.id] = job
+        self._executor.submit(job.run, fn, *args, **kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None, poll_interval=0.1):
+        job = self.get(job_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while job is not None and not job.done:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        return job
+
+    def _prune(self):
+        limit = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < limit]:
+            del self._jobs[job_id]
+
+
+# Cola compartida por todo el proceso (todas las sesiones de Streamlit)
+default_queue = process_default(JobQueue)
+
+
+def analyze_file(source, digest=None, mapping=None, name=None, n_clusters=N_CLUSTERS, engine=ENGINE, report=None,
+                 refit=False, model_dir=MODEL_DIR, time_budget=TIME_BUDGET, on_stage=None):
+    # Análisis completo de un fichero por etapas (cargar, limpiar, agregar, agrupar, resumir) sobre el almacén
+    # Arrow. Los clientes se asignan con el modelo guardado salvo refit=True (ver model.segment_with_model).
+    # Devuelve (cluster_analysis, rfm) como pipeline.segment
+    stage = on_stage or (lambda name: None)
+    stage('load')
+    if digest is None:
+        with span('digest'):
+            digest = file_digest(source)
+    path = store_path(digest, mapping)
+    stage('clean')
+    if not os.path.exists(path):
+        convert(source, path, mapping=mapping, name=name)
+    stage('aggregate')
+    rfm_table = rfm_from_store(path)
+    return segment_with_model(rfm_table, n_clusters=n_clusters, engine=engine, refit=refit, report=report,
+                              time_budget=time_budget, directory=model_dir, on_stage=on_stage)
+
+
+def analyze_state(path=STATE_PATH, n_clusters=N_CLUSTERS, engine=ENGINE, report=None, refit=False,
+                  model_dir=MODEL_DIR, time_budget=TIME_BUDGET, on_stage=None, now=None):
+    # Análisis del estado acumulado por state.ingest_delta(): la tabla RFM sale del estado, sin leer exports.
+    # Devuelve (cluster_analysis, rfm) como analyze_file
+    stage = on_stage or (lambda name: None)
+    stage('load')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe el estado {path}; créalo con 'python -m rfm ingest'")
+    stage('aggregate')
+    with span('aggregate') as current:
+        rfm_table = rfm_from_state(path, now)
+        current.rows_out = len(rfm_table)
+    return segment_with_model(rfm_table, n_clusters=n_clusters, engine=engine, refit=refit, report=report,
+                              time_budget=time_budget, directory=model_dir, on_stage=on_stage)
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from .schema import REQUIRED_COLUMNS
+
+
+def load_file(source, name=None):
+    # Acepta una ruta o un fichero subido (con atributo .name); el formato se decide por la extensión
+    name = name or getattr(source, 'name', None) or str(source)
+    if name.endswith('.csv'):
+        return pd.read_csv(source)
+    if name.endswith('.xlsx'):
+        return pd.read_excel(source)
+    raise ValueError(f"Formato de archivo no soportado: {name}. Usa un archivo .csv o .xlsx.")
+
+
+def missing_columns(df, required=REQUIRED_COLUMNS):
+    # Acepta un DataFrame o directamente la lista de columnas del fichero
+    columns = getattr(df, 'columns', df)
+    return [col for col in required if col not in columns]
+
+
+def map_columns(df, mapping):
+    # mapping: {columna estándar: columna del fichero}
+    mapped = df[[mapping[col] for col in REQUIRED_COLUMNS]].copy()
+    mapped.columns = REQUIRED_COLUMNS
+    return mapped
@@ -0,0 +1,225 @@
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .cache import code_version
+from .clustering import ENGINE, N_CLUSTERS, N_INIT, PREDICT_CHUNK, RANDOM_STATE, fit_predict
+from .instrument import span
+from .pipeline import AUTO_K, segment
+from .quintiles import QUINTILES
+from .schema import RFM_COLUMNS
+from .selection import TIME_BUDGET, record_selection, select_k
+from .shared import AtomicPath
+from .summary import segment_map, segment_name, summarize
+
+# Modelos de segmentación guardados: un JSON por versión (segmentation-v0001.json, ...) en este directorio
+MODEL_DIR = os.environ.get('RFM_MODEL_DIR', os.path.join(tempfile.gettempdir(), 'rfm_models'))
+# Aumento relativo de la distancia media a los centroides a partir del cual se reajusta el modelo
+DRIFT_THRESHOLD = 0.25
+# Clientes puntuados a partir de los que se mide la deriva
+MIN_DRIFT_SAMPLE = 1000
+
+_VERSION_PATTERN = re.compile(r'segmentation-v(\d+)\.json$')
+
+
+class SegmentationModel:
+    # Escalado (log1p + estandarización), centroides y nombre de segmento de cada centroide.
+    # Los centroides se guardan ordenados de mejor a peor segmento: el id de cluster es su posición,
+    # así que los ids y nombres no cambian entre ejecuciones que puntúan con el mismo modelo
+
+    def __init__(self, mean, scale, centroids, baseline, version=None, metadata=None):
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.centroids = np.asarray(centroids, dtype=float)
+        # Distancia cuadrática media al centroide más cercano sobre los datos de ajuste
+        self.baseline = float(baseline)
+        self.version = version
+        self.metadata = metadata or {}
+
+    @property
+    def segments(self):
+        return [segment_name(i) for i in range(len(self.centroids))]
+
+    @classmethod
+    def fit(cls, rfm, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init=N_INIT, engine=ENGINE,
+            time_budget=TIME_BUDGET, report=None):
+        from sklearn.preprocessing import StandardScaler
+
+        scaler = StandardScaler().fit(np.log1p(rfm[RFM_COLUMNS]))
+        features = scaler.transform(np.log1p(rfm[RFM_COLUMNS]))
+        if n_clusters == AUTO_K:
+            n_clusters, diagnostics = select_k(features, time_budget=time_budget, random_state=random_state,
+                                               n_init=n_init)
+            record_selection(report, diagnostics, time_budget)
+        labels, kmeans, clustering_report = fit_predict(features, n_clusters=n_clusters, random_state=random_state,
+                                                        n_init=n_init, engine=engine)
+        if report is not None:
+            report.update(clustering_report)
+        # Orden de valor de summarize(); los clusters que se quedaran vacíos van al final
+        ranked = list(summarize(rfm.assign(Cluster=labels)).index)
+        order = ranked + [i for i in range(n_clusters) if i not in ranked]
+        metadata = {
+            'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'code_version': code_version(),
+            'engine': clustering_report['engine'],
+            'n_customers': len(rfm),
+        }
+        return cls(scaler.mean_, scaler.scale_, kmeans.cluster_centers_[order],
+                   clustering_report['inertia'] / len(rfm), metadata=metadata)
+
+    def features(self, rfm):
+        return (np.log1p(rfm[RFM_COLUMNS].to_numpy(dtype=float)) - self.mean) / self.scale
+
+    def predict(self, rfm, chunk_size=PREDICT_CHUNK):
+        # Centroide más cercano y distancia cuadrática a él, por trozos y sin sklearn
+        features = self.features(rfm)
+        labels = np.empty(len(features), dtype=np.int32)
+        distances = np.empty(len(features))
+        centroid_norms = (self.centroids ** 2).sum(axis=1)
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            squared = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ self.centroids.T + centroid_norms
+            labels[start:start + chunk_size] = squared.argmin(axis=1)
+            distances[start:start + chunk_size] = np.maximum(squared.min(axis=1), 0)
+        return labels, distances
+
+    def drift(self, distances):
+        # Aumento relativo de la distancia media respecto a la del ajuste (0 = igual que al entrenar)
+        if len(distances) == 0 or self.baseline <= 0:
+            return 0.0
+        return float(distances.mean() / self.baseline - 1)
+
+    def assign(self, rfm, labels):
+        # Devuelve (cluster_analysis, rfm con Cluster y Segmento) con los ids y nombres del modelo
+        rfm = rfm.assign(Cluster=labels)
+        cluster_analysis = summarize(rfm).reindex(range(len(self.centroids)))
+        cluster_analysis['Count'] = cluster_analysis['Count'].fillna(0).astype(int)
+        rfm['Segmento'] = rfm['Cluster'].map(segment_map(cluster_analysis))
+        return cluster_analysis, rfm
+
+    def score(self, rfm):
+        return self.assign(rfm, self.predict(rfm)[0])
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'centroids': self.centroids.tolist(),
+            'segments': self.segments,
+            'baseline': self.baseline,
+            'metadata': self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['mean'], data['scale'], data['centroids'], data['baseline'], version=data.get('version'),
+                   metadata=data.get('metadata'))
+
+
+def model_versions(directory=MODEL_DIR):
+    versions = []
+    for path in glob.glob(os.path.join(directory, 'segmentation-v*.json')):
+        match = _VERSION_PATTERN.search(os.path.basename(path))
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def model_path(version, directory=MODEL_DIR):
+    return os.path.join(directory, f'segmentation-v{version:04d}.json')
+
+
+def latest_version(directory=MODEL_DIR):
+    versions = model_versions(directory)
+    return versions[-1] if versions else None
+
+
+def save_model(model, directory=MODEL_DIR):
+    # Guarda el modelo como la siguiente versión; las anteriores se conservan para poder volver a ellas.
+    # Varios procesos pueden reajustar a la vez (CLI, servicio): os.link falla si la versión ya existe y se
+    # prueba con la siguiente, así nunca se sobrescribe un modelo ya publicado
+    os.makedirs(directory, exist_ok=True)
+    version = latest_version(directory) or 0
+    while True:
+        version += 1
+        model.version = version
+        try:
+            with AtomicPath(model_path(version, directory), publish=os.link) as tmp:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(model.to_dict(), f, ensure_ascii=False, indent=2)
+            return version
+        except FileExistsError:
+            continue
+
+
+def load_model(version=None, directory=MODEL_DIR):
+    # Última versión si no se indica otra; None si no hay ningún modelo guardado
+    if version is None:
+        version = latest_version(directory)
+        if version is None:
+            return None
+    with open(model_path(version, directory), encoding='utf-8') as f:
+        return SegmentationModel.from_dict(json.load(f))
+
+
+def score_or_refit(rfm, directory=MODEL_DIR, drift_threshold=DRIFT_THRESHOLD, report=None, base=None,
+                   min_drift_sample=MIN_DRIFT_SAMPLE, refit=False, **fit_params):
+    # Camino rápido: asigna los clientes con el último modelo guardado. La deriva solo se mide con al menos
+    # min_drift_sample clientes (con menos, la media de distancias no es representativa). Si no hay modelo,
+    # se pide refit, se pide explícitamente otro nº de segmentos (fit_params['n_clusters']) o la deriva supera
+    # drift_threshold se reajusta (con fit_params) sobre base, la tabla RFM de toda la base de clientes, y se
+    # guarda como nueva versión; nunca se reajusta solo con los clientes puntuados. Sin base, una deriva
+    # excesiva solo se informa ('drift_exceeded') y se asigna con el modelo actual.
+    # Devuelve (cluster_analysis, rfm) como pipeline.segment; report recibe versión, deriva y si hubo reajuste
+    if rfm.empty:
+        return None, None
+    report = report if report is not None else {}
+    model = None if refit else load_model(directory=directory)
+    n_clusters = fit_params.get('n_clusters', AUTO_K)
+    if model is not None and n_clusters != AUTO_K and n_clusters != len(model.centroids):
+        model = None
+    if model is not None:
+        start = time.perf_counter()
+        labels, distances = model.predict(rfm)
+        report['score_seconds'] = time.perf_counter() - start
+        report.update(model_version=model.version, refit=False, n_clusters=len(model.centroids),
+                      engine=model.metadata.get('engine', ENGINE), n_customers=len(rfm))
+        if len(rfm) < min_drift_sample:
+            return model.assign(rfm, labels)
+        report['drift'] = model.drift(distances)
+        report['drift_exceeded'] = report['drift'] > drift_threshold
+        if not report['drift_exceeded'] or base is None:
+            return model.assign(rfm, labels)
+    elif base is None:
+        base = rfm
+    model = SegmentationModel.fit(base, report=report, **fit_params)
+    save_model(model, directory)
+    report.update(model_version=model.version, refit=True, n_clusters=len(model.centroids))
+    return model.score(rfm)
+
+
+def segment_with_model(rfm, n_clusters=N_CLUSTERS, engine=ENGINE, refit=False, report=None, time_budget=TIME_BUDGET,
+                       directory=MODEL_DIR, on_stage=None):
+    # Como pipeline.segment, pero los motores de clustering asignan con el modelo guardado (score_or_refit):
+    # los ids y nombres de segmento no cambian entre análisis y solo se reajusta sobre rfm (la base completa)
+    # si se pide refit, no hay modelo, cambia el nº de segmentos o hay deriva. Los quintiles no tienen modelo
+    if engine == QUINTILES:
+        return segment(rfm, n_clusters=n_clusters, engine=engine, report=report, on_stage=on_stage)
+    if rfm.empty:
+        return None, None
+    if on_stage is not None:
+        on_stage('cluster')
+    with span('cluster', rows_in=len(rfm)) as current:
+        cluster_analysis, rfm = score_or_refit(rfm, directory, report=report, base=rfm, refit=refit,
+                                               n_clusters=n_clusters, engine=engine, time_budget=time_budget)
+        current.rows_out = len(rfm)
+    if on_stage is not None:
+        on_stage('summarize')
+    return cluster_analysis, rfm
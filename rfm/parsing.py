@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+
+# Filas que se miran para decidir los separadores decimal y de miles
+SAMPLE_SIZE = 1000
+# Sin evidencia en la muestra se asume el formato español ("1.234,56")
+DEFAULT_SEPARATORS = (',', '.')
+
+# Caracteres que se descartan siempre: espacios (también los no separables) y símbolo de moneda
+_STRIP_CHARS = ' \xa0\u202f€'
+
+
+def _sample(series, sample_size):
+    # Primeros valores no nulos sin recorrer la columna entera
+    return series.head(sample_size * 10).dropna().head(sample_size)
+
+
+def _separator_vote(text):
+    # Devuelve el separador decimal que delata un valor, o None si es ambiguo ("1.234", "1,234", "12")
+    has_dot, has_comma = '.' in text, ',' in text
+    if has_dot and has_comma:
+        return '.' if text.rfind('.') > text.rfind(',') else ','
+    sep = '.' if has_dot else ',' if has_comma else None
+    if sep is None:
+        return None
+    if text.count(sep) > 1:
+        # "1.234.567": el separador repetido es el de miles
+        return ',' if sep == '.' else '.'
+    decimals = text.rsplit(sep, 1)[1]
+    if len(decimals) != 3 or not decimals.isdigit():
+        return sep
+    return None
+
+
+def detect_separators(series, sample_size=SAMPLE_SIZE):
+    # Devuelve (decimal, miles) a partir de una muestra de los valores de texto de la columna
+    votes = {'.': 0, ',': 0}
+    for value in _sample(series, sample_size):
+        if isinstance(value, str):
+            sep = _separator_vote(value.strip(_STRIP_CHARS))
+            if sep is not None:
+                votes[sep] += 1
+    if votes['.'] == votes[',']:
+        return DEFAULT_SEPARATORS
+    return ('.', ',') if votes['.'] > votes[','] else (',', '.')
+
+
+def _strip_table():
+    return {ord(ch): None for ch in _STRIP_CHARS}
+
+
+def _parse_text(text, decimal, thousands):
+    # Camino rápido: quitar miles, normalizar el decimal y astype(float) en C. Solo si alguna celda
+    # no es un número se repite con limpieza de espacios/moneda y pd.to_numeric(errors='coerce')
+    text = text.str.replace(thousands, '', regex=False)
+    if decimal != '.':
+        text = text.str.replace(decimal, '.', regex=False)
+    try:
+        return text.astype(float)
+    except ValueError:
+        return pd.to_numeric(text.str.translate(_strip_table()), errors='coerce').astype(float)
+
+
+def parse_numeric_report(series, decimal=None, thousands=None):
+    # Convierte una columna de importes y devuelve (valores, máscara de celdas mal formadas).
+    # Las celdas que no se pueden interpretar quedan como NaN en lugar de lanzar una excepción.
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float), pd.Series(False, index=series.index)
+    if decimal is None or thousands is None:
+        decimal, thousands = detect_separators(series)
+    if pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        values = _parse_text(series, decimal, thousands)
+    else:
+        # Columnas mixtas (típicas de read_excel): los números se respetan y solo se traduce el texto
+        is_text = series.map(type) == str
+        values = _parse_text(series.where(is_text), decimal, thousands)
+        values = values.fillna(pd.to_numeric(series.where(~is_text), errors='coerce'))
+    return values, values.isna() & series.notna()
+
+
+def parse_numeric(series, decimal=None, thousands=None):
+    return parse_numeric_report(series, decimal=decimal, thousands=thousands)[0]
+
+
+# Formatos de fecha candidatos, del más habitual en nuestros exports al menos
+DATE_FORMATS = [
+    '%d/%m/%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y',
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d',
+]
+# Origen de los números de serie de fecha de Excel
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+
+def detect_date_format(series, sample_size=SAMPLE_SIZE):
+    # Prueba los formatos candidatos sobre una muestra y devuelve el que más fechas interpreta (o None)
+    sample = _sample(series, sample_size)
+    sample = sample[sample.map(type) == str]
+    if sample.empty:
+        return None
+    best, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if count > best_count:
+            best, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best
+
+
+_FIELD_WIDTHS = {'d': 2, 'm': 2, 'Y': 4, 'H': 2, 'M': 2, 'S': 2}
+
+
+def _fixed_layout(date_format):
+    # {campo: (inicio, ancho)}, {posición: separador} y ancho total de un formato de ancho fijo, o None
+    fields, separators, pos, i = {}, {}, 0, 0
+    while i < len(date_format):
+        if date_format[i] == '%':
+            field = date_format[i + 1]
+            if field not in _FIELD_WIDTHS:
+                return None
+            fields[field] = (pos, _FIELD_WIDTHS[field])
+            pos += _FIELD_WIDTHS[field]
+            i += 2
+        else:
+            separators[pos] = ord(date_format[i])
+            pos += 1
+            i += 1
+    return fields, separators, pos
+
+
+def _parse_fixed_width(text, date_format):
+    # Parser vectorizado para formatos de ancho fijo (DD/MM/AAAA, ISO...): opera sobre los bytes con numpy
+    # en lugar de interpretar cada cadena. Devuelve None si la columna no encaja en el formato.
+    layout = _fixed_layout(date_format)
+    if layout is None:
+        return None
+    fields, separators, width = layout
+    present = text.notna().to_numpy()
+    try:
+        raw = np.array(text[present].tolist(), dtype=f'S{width + 1}')
+    except (UnicodeEncodeError, TypeError):
+        return None
+    grid = raw.view(np.uint8).reshape(-1, width + 1)
+    ok = (grid[:, width] == 0) & (grid[:, width - 1] != 0)
+    for position, char in separators.items():
+        ok &= grid[:, position] == char
+
+    def number(field, default=0):
+        if field not in fields:
+            return np.full(len(grid), default, dtype=np.int64)
+        start, size = fields[field]
+        digits = grid[:, start:start + size].astype(np.int64) - 48
+        nonlocal ok
+        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        return digits @ (10 ** np.arange(size - 1, -1, -1))
+
+    day, month, year = number('d', 1), number('m', 1), number('Y', 1970)
+    hour, minute, second = number('H'), number('M'), number('S')
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month - 1, 0, 11)] + (leap & (month == 2))
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) & (hour < 24) & (minute < 60) & (second < 60)
+    # Días desde 1970-01-01 a partir de la fecha civil (algoritmo days_from_civil)
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    seconds = (era * 146097 + doe - 719468) * 86400 + hour * 3600 + minute * 60 + second
+    values = np.full(len(text), np.datetime64('NaT'), dtype='datetime64[ns]')
+    values[np.flatnonzero(present)[ok]] = (seconds[ok] * 10 ** 9).astype('datetime64[ns]')
+    return pd.Series(values, index=text.index)
+
+
+def _parse_unique_dates(text, date_format):
+    if date_format is None:
+        return pd.to_datetime(text, dayfirst=True, errors='coerce')
+    parsed = _parse_fixed_width(text, date_format)
+    if parsed is None:
+        parsed = pd.to_datetime(text, format=date_format, errors='coerce')
+    # Las pocas celdas con otro formato se reintentan con el parser genérico (DD/MM primero)
+    leftover = parsed.isna() & text.notna()
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(text[leftover], format='mixed', dayfirst=True, errors='coerce')
+    return parsed
+
+
+def _parse_date_text(text, date_format):
+    # Cada cadena distinta se parsea una sola vez: los exports repiten mucho las mismas fechas
+    codes, uniques = pd.factorize(text)
+    parsed = _parse_unique_dates(pd.Series(uniques, dtype=object), date_format).to_numpy(dtype='datetime64[ns]')
+    values = np.full(len(text), np.datetime64('NaT'), dtype='datetime64[ns]')
+    found = codes >= 0
+    values[found] = parsed[codes[found]]
+    return pd.Series(values, index=text.index)
+
+
+def parse_dates(series, date_format=None):
+    # Convierte la columna de fecha una sola vez: fechas ya tipadas (read_excel) se respetan, los números
+    # se interpretan como serie de Excel y el texto con un formato explícito detectado en una muestra
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if pd.api.types.is_numeric_dtype(series):
+        return EXCEL_EPOCH + pd.to_timedelta(series, unit='D', errors='coerce')
+    if date_format is None:
+        date_format = detect_date_format(series)
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred in ('string', 'empty'):
+        return _parse_date_text(series, date_format)
+    # Columna mixta: fechas/números de Excel junto a texto
+    is_text = series.map(type) == str
+    parsed = _parse_date_text(series.where(is_text), date_format)
+    others = series.where(~is_text)
+    numbers = pd.to_numeric(others, errors='coerce')
+    parsed = parsed.fillna(EXCEL_EPOCH + pd.to_timedelta(numbers, unit='D'))
+    return parsed.fillna(pd.to_datetime(others.where(numbers.isna()), errors='coerce'))
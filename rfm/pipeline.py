@@ -0,0 +1,58 @@
+from .clustering import ENGINE, N_CLUSTERS, N_INIT, RANDOM_STATE, cluster, scale
+from .instrument import span
+from .quintiles import QUINTILES, SEGMENT_RULES, score_segments
+from .scoring import compute_rfm
+from .selection import TIME_BUDGET, record_selection, select_k
+from .summary import assign_segments, summarize
+
+# Valor de n_clusters que elige el nº de segmentos automáticamente (codo + silueta)
+AUTO_K = 'auto'
+
+
+def segment(rfm, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init=N_INIT, engine=ENGINE, report=None,
+            time_budget=TIME_BUDGET, on_stage=None):
+    # Segmenta una tabla RFM ya calculada. Devuelve (cluster_analysis, rfm) o (None, None) si está vacía.
+    # Si se pasa un dict en report, se rellena con el motor usado, tiempos e inercia del clustering
+    # y, con n_clusters='auto', con la tabla de diagnóstico de la selección de k ('selection') y 'k_fallback' si
+    # se agotó time_budget sin ningún k evaluado (ver selection.record_selection).
+    # Con engine='quintiles' no hay clustering: n_clusters se ignora y los segmentos salen de las
+    # puntuaciones R/F/M, siempre en el orden de SEGMENT_NAMES (si alguno queda vacío,
+    # con Count 0 y medias NaN).
+    # on_stage('cluster') y on_stage('summarize') marcan el inicio de cada etapa (ver jobs.py)
+    if rfm.empty:
+        return None, None
+    if on_stage is not None:
+        on_stage('cluster')
+    if n_clusters == AUTO_K and engine != QUINTILES:
+        with span('select_k', rows_in=len(rfm)):
+            n_clusters, diagnostics = select_k(scale(rfm), time_budget=time_budget, random_state=random_state,
+                                               n_init=n_init)
+        record_selection(report, diagnostics, time_budget)
+    with span('cluster', rows_in=len(rfm)) as current:
+        if engine == QUINTILES:
+            rfm, clustering_report = score_segments(rfm)
+        else:
+            rfm, clustering_report = cluster(rfm, n_clusters=n_clusters, random_state=random_state,
+                                             n_init=n_init, engine=engine)
+        current.rows_out = len(rfm)
+    if report is not None:
+        report.update(clustering_report)
+    if on_stage is not None:
+        on_stage('summarize')
+    with span('summarize', rows_in=len(rfm)) as current:
+        cluster_analysis = summarize(rfm)
+        if engine == QUINTILES:
+            cluster_analysis = cluster_analysis.reindex(range(len(SEGMENT_RULES)))
+            cluster_analysis['Count'] = cluster_analysis['Count'].fillna(0).astype(int)
+        rfm = assign_segments(rfm, cluster_analysis)
+        current.rows_out = len(cluster_analysis)
+    return cluster_analysis, rfm
+
+
+def analyze(df, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init=N_INIT, engine=ENGINE, report=None,
+            time_budget=TIME_BUDGET):
+    # df ya limpio (ver cleaning.clean)
+    if df.empty:
+        return None, None
+    return segment(compute_rfm(df), n_clusters=n_clusters, random_state=random_state, n_init=n_init, engine=engine,
+                   report=report, time_budget=time_budget)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from .summary import segment_labels
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+# Valor z del intervalo de confianza del simulador (95 %)
+CONFIDENCE_Z = 1.96
+
+
+class SegmentProfile:
+    # Resumen por segmento calculado una vez por resultado: tamaño, medias, desviación y cuantiles del gasto
+    # e ingresos totales, en arrays alineados con el orden de cluster_analysis (de mejor a peor segmento;
+    # los segmentos sin clientes del motor por quintiles quedan a 0, también sus cuantiles).
+    # El simulador y las gráficas solo leen de aquí; las figuras de Plotly se crean la primera vez que se
+    # piden y se reutilizan en los reruns
+
+    def __init__(self, cluster_analysis, rfm):
+        self.labels = segment_labels(cluster_analysis)
+        self.positions = {label: i for i, label in enumerate(self.labels)}
+        # compact() guarda el gasto en float32: se agrega en float64 para no perder céntimos en totales y medias
+        rfm = rfm.assign(Monetary=rfm['Monetary'].astype('float64'))
+        grouped = rfm.groupby('Cluster', sort=False)
+        monetary = grouped['Monetary']
+        order = cluster_analysis.index
+        self.counts = grouped.size().reindex(order, fill_value=0).to_numpy()
+        means = grouped[['Recency', 'Frequency', 'Monetary']].mean()
+        self.means = means.reindex(order, fill_value=0).astype('float64')
+        self.means.index = pd.Index(self.labels, name='Segmento')
+        self.std = monetary.std(ddof=0).reindex(order).fillna(0).to_numpy(dtype='float64')
+        self.quantiles = monetary.quantile(list(QUANTILES)).unstack().reindex(order).fillna(0).astype('float64')
+        self.quantiles.index = self.means.index
+        # Los importes de compact() arrastran el error de float32 (~1e-5 por cliente): el total se redondea a céntimos
+        self.revenue = monetary.sum().reindex(order, fill_value=0).round(2).to_numpy(dtype='float64')
+        self.revenue_share = self.revenue / self.revenue.sum() if self.revenue.sum() else np.zeros(len(order))
+        self._figures = {}
+
+    def simulate(self, segment, conversion):
+        # Ingresos si compra el conversion % del segmento, con el gasto medio del segmento.
+        # El rango es el intervalo de confianza de la suma de gasto de k clientes elegidos al azar
+        # (sin reemplazo, de ahí la corrección por población finita)
+        i = self.positions[segment]
+        n = int(self.counts[i])
+        k = int(n * conversion / 100)
+        mean = float(self.means['Monetary'].iloc[i])
+        estimate = k * mean
+        correction = (n - k) / (n - 1) if n > 1 else 0.0
+        margin = CONFIDENCE_Z * self.std[i] * np.sqrt(k * correction)
+        return {
+            'customers': k,
+            'mean': mean,
+            'median': float(self.quantiles[0.5].iloc[i]),
+            'revenue': estimate,
+            'low': max(estimate - margin, 0.0),
+            'high': estimate + margin,
+        }
+
+    def figure(self, name):
+        if name not in self._figures:
+            self._figures[name] = getattr(self, f'_{name}_figure')()
+        return self._figures[name]
+
+    def _frame(self):
+        return pd.DataFrame({'Segmento': self.labels, 'Count': self.counts, 'Ingresos': self.revenue})
+
+    def _bar_figure(self):
+        import plotly.express as px
+
+        return px.bar(self._frame(), x='Segmento', y='Count', title="Clientes por segmento")
+
+    def _pie_figure(self):
+        import plotly.express as px
+
+        return px.pie(self._frame(), names='Segmento', values='Count', title="Distribución porcentual de los segmentos")
+
+    def _revenue_figure(self):
+        import plotly.express as px
+
+        return px.bar(self._frame(), x='Segmento', y='Ingresos', title="Ingresos totales por segmento")
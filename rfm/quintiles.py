@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from .schema import RFM_COLUMNS
+from .summary import SEGMENT_NAMES
+
+# Motor de segmentación sin clustering: puntuación clásica R/F/M de 1 a 5 por quintiles y reglas fijas que
+# asignan cada combinación a un segmento. No hay ajuste ni aleatoriedad: los mismos datos dan siempre los
+# mismos segmentos, y el coste es lineal en el nº de clientes
+QUINTILES = 'quintiles'
+BINS = 5
+# Una regla por nombre de SEGMENT_NAMES (el id de segmento es la posición): la primera que se cumple decide.
+# FM es la media de las puntuaciones de frecuencia y gasto
+SEGMENT_RULES = list(zip(SEGMENT_NAMES, [
+    lambda r, fm: (r >= 4) & (fm >= 4),
+    lambda r, fm: (r >= 3) & (fm >= 3),
+    lambda r, fm: r >= 3,
+    lambda r, fm: fm >= 3,
+    lambda r, fm: np.ones_like(r, dtype=bool),
+]))
+
+
+def quintile_edges(values, bins=BINS):
+    # Cortes de los cuantiles interiores; np.quantile usa una selección parcial, sin ordenar toda la columna
+    return np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+
+
+def quintile_score(values, bins=BINS, reverse=False):
+    # Puntuación de 1 a bins según el cuantil de cada valor; los empates caen siempre en la misma puntuación.
+    # Con reverse=True los valores bajos puntúan más (Recency: compra reciente = 5)
+    values = np.asarray(values, dtype='float64')
+    position = np.searchsorted(quintile_edges(values, bins), values, side='left')
+    return (bins - position if reverse else position + 1).astype(np.int8)
+
+
+def quintile_scores(rfm, bins=BINS):
+    recency, frequency, monetary = RFM_COLUMNS
+    return pd.DataFrame({
+        'R': quintile_score(rfm[recency], bins, reverse=True),
+        'F': quintile_score(rfm[frequency], bins),
+        'M': quintile_score(rfm[monetary], bins),
+    }, index=rfm.index)
+
+
+def score_segments(rfm, bins=BINS):
+    # Devuelve (rfm con la columna Cluster = posición del segmento en SEGMENT_RULES, informe), con el mismo
+    # formato de informe que clustering.cluster()
+    start = time.perf_counter()
+    scores = quintile_scores(rfm, bins)
+    r, fm = scores['R'].to_numpy(), (scores['F'].to_numpy() + scores['M'].to_numpy()) / 2
+    conditions = [rule(r, fm) for _, rule in SEGMENT_RULES]
+    rfm = rfm.copy()
+    rfm['Cluster'] = np.select(conditions, np.arange(len(SEGMENT_RULES), dtype=np.int32)).astype(np.int32)
+    report = {
+        'engine': QUINTILES,
+        'n_clusters': len(SEGMENT_RULES),
+        'n_customers': len(rfm),
+        'n_fit': len(rfm),
+        'fit_seconds': 0.0,
+        'predict_seconds': time.perf_counter() - start,
+        'inertia': None,
+    }
+    return rfm, report
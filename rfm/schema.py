@@ -0,0 +1,14 @@
+# Nombres de columna que usa todo el análisis RFM
+EMAIL = 'Correo electrónico'
+DATE = 'Fecha de última compra'
+MONETARY = 'Importe total'
+FREQUENCY = 'Total de compras'
+NEWSLETTER = 'Suscrito a newsletter'
+
+REQUIRED_COLUMNS = [EMAIL, DATE, MONETARY, FREQUENCY, NEWSLETTER]
+NUMERIC_COLUMNS = [MONETARY, FREQUENCY]
+
+# Valor de la columna de newsletter que marca a un cliente como suscrito
+SUBSCRIBED = 'Si'
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
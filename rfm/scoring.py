@@ -0,0 +1,65 @@
+import pandas as pd
+
+from .schema import DATE, EMAIL, FREQUENCY, MONETARY, RFM_COLUMNS
+
+AGGREGATE_COLUMNS = ['last_purchase', 'Frequency', 'Monetary']
+# Agregados parciales que se acumulan antes de fusionarlos: fusionar con el total en cada trozo cuesta
+# trozos × clientes; así el total solo se vuelve a agrupar una vez cada COMBINE_EVERY trozos
+COMBINE_EVERY = 16
+
+
+def reference_date(df):
+    # Fecha de referencia para la recencia: un día después de la última compra registrada
+    return df[DATE].max() + pd.Timedelta(days=1)
+
+
+def aggregate(df):
+    # Agregados parciales por cliente (última compra, nº de compras y gasto) con reducciones nativas de pandas
+    return df.groupby(EMAIL).agg(
+        last_purchase=(DATE, 'max'),
+        Frequency=(FREQUENCY, 'sum'),
+        Monetary=(MONETARY, 'sum')
+    )
+
+
+def combine_aggregates(parts):
+    # Fusiona agregados parciales (p. ej. de distintos trozos de un fichero) en uno por cliente
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS).rename_axis(EMAIL)
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=0).agg({
+        'last_purchase': 'max',
+        'Frequency': 'sum',
+        'Monetary': 'sum'
+    })
+
+
+def fold_partials(partials, combine, every=COMBINE_EVERY):
+    # Fusiona con combine(lista) los agregados parciales de un iterable por tandas de `every`: en memoria quedan
+    # como mucho `every` parciales además del total acumulado. Sirve igual para DataFrames y tablas Arrow
+    parts = []
+    for part in partials:
+        parts.append(part)
+        if len(parts) > every:
+            parts = [combine(parts)]
+    return combine(parts)
+
+
+def finalize(aggregates, now=None):
+    # Convierte los agregados en la tabla RFM con la recencia en días respecto a `now`
+    if aggregates.empty:
+        return pd.DataFrame(columns=RFM_COLUMNS).rename_axis(EMAIL)
+    if now is None:
+        now = aggregates['last_purchase'].max() + pd.Timedelta(days=1)
+    rfm = aggregates[['Frequency', 'Monetary']].copy()
+    rfm.insert(0, 'Recency', (now - aggregates['last_purchase']).dt.days)
+    # Frequency y Monetary deben ser positivos para la transformación logarítmica
+    return rfm[(rfm['Frequency'] > 0) & (rfm['Monetary'] > 0)]
+
+
+def compute_rfm(df, now=None):
+    if now is None:
+        now = reference_date(df)
+    return finalize(aggregate(df), now)
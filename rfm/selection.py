@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import pandas as pd
+
+from .clustering import N_CLUSTERS, N_INIT, RANDOM_STATE, fit_predict, stratified_sample
+
+# Valores de k candidatos, presupuesto de tiempo total (segundos, configurable con RFM_TIME_BUDGET) y tamaños
+# de muestra para ajustar y puntuar
+K_VALUES = range(3, 9)
+TIME_BUDGET = float(os.environ.get('RFM_TIME_BUDGET', 20.0))
+FIT_SAMPLE = 50_000
+SILHOUETTE_SAMPLE = 5_000
+
+
+def _score_k(features, k, random_state, n_init, silhouette_sample):
+    # Se ejecuta en un proceso del pool: un solo hilo de BLAS/OpenMP por proceso para no sobresuscribir CPUs
+    from sklearn.metrics import silhouette_score
+    from threadpoolctl import threadpool_limits
+
+    start = time.perf_counter()
+    with threadpool_limits(1):
+        labels, _, report = fit_predict(features, n_clusters=k, random_state=random_state, n_init=n_init,
+                                        engine='kmeans')
+        silhouette = silhouette_score(features, labels, sample_size=min(silhouette_sample, len(features)),
+                                      random_state=random_state)
+    return {
+        'k': k,
+        'inertia': report['inertia'],
+        'silhouette': float(silhouette),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def select_k(features, k_values=K_VALUES, time_budget=TIME_BUDGET, n_jobs=None, random_state=RANDOM_STATE,
+             n_init=N_INIT, fit_sample=FIT_SAMPLE, silhouette_sample=SILHOUETTE_SAMPLE, default_k=N_CLUSTERS):
+    # Ajusta los k candidatos en paralelo (procesos) sobre una muestra estratificada y los puntúa con la inercia
+    # (método del codo) y la silueta muestreada. Al agotar time_budget devuelve lo terminado hasta entonces.
+    # Devuelve (mejor k, tabla de diagnóstico); sin ningún k terminado se usa default_k.
+    features = features[stratified_sample(features, fit_sample, random_state=random_state)]
+    k_values = [k for k in k_values if 1 < k < len(features)]
+    deadline = time.monotonic() + time_budget
+    rows = []
+    # Pool de procesos propio de esta llamada (loky no reimporta el script en los workers): al agotar el
+    # presupuesto se paran sus workers sin afectar a otros select_k que se ejecuten a la vez en otros hilos
+    from joblib.externals.loky import ProcessPoolExecutor
+
+    executor = ProcessPoolExecutor(max_workers=n_jobs or min(len(k_values), os.cpu_count() or 1) or 1)
+    pending = set()
+    try:
+        pending = {executor.submit(_score_k, features, k, random_state, n_init, silhouette_sample)
+                   for k in k_values}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            rows.extend(future.result() for future in done)
+    finally:
+        # Con k pendientes (presupuesto agotado) se descartan y se paran los ajustes en curso
+        executor.shutdown(wait=not pending, kill_workers=bool(pending))
+    diagnostics = pd.DataFrame(rows, columns=['k', 'inertia', 'silhouette', 'seconds']).sort_values('k')
+    diagnostics = diagnostics.set_index('k')
+    # Caída relativa de la inercia respecto al k anterior, para leer el "codo"
+    diagnostics['inertia_drop'] = -diagnostics['inertia'].pct_change()
+    if diagnostics.empty:
+        return default_k, diagnostics
+    return int(diagnostics['silhouette'].idxmax()), diagnostics
+
+
+def record_selection(report, diagnostics, time_budget):
+    # Deja en el informe la tabla de diagnóstico ('selection') y el presupuesto usado; 'k_fallback' marca que no
+    # terminó ningún k candidato a tiempo y se usó el k por defecto, para avisar en la app y el CLI
+    if report is None:
+        return
+    report.update(selection=diagnostics, time_budget=time_budget, k_fallback=diagnostics.empty)
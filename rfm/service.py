@@ -0,0 +1,329 @@
+# Servicio de análisis compartido: un proceso de larga duración con una sola caché de resultados, almacenes,
+# descargas y cola de trabajos para todas las sesiones (y todos los procesos de Streamlit) que lo usan.
+# Un mismo export subido por varias personas se guarda, valida y convierte una sola vez, y un análisis con
+# los mismos parámetros se calcula una vez aunque lo pidan varias sesiones a la vez.
+# Uso: python -m rfm.service [--host 127.0.0.1] [--port 8765] [--time-budget segundos]; la app lo usa si RFM_SERVICE_URL apunta a él
+# (ver client.py). Sin servicio, la app usa un Service dentro de su propio proceso con la misma interfaz.
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from .cache import ResultCache, default_cache, file_digest, result_key
+from .compact import compact
+from .exports import FORMATS, ensure_export, export_path
+from .jobs import FAILED, analyze_file, default_queue
+from .model import MODEL_DIR, latest_version
+from .quintiles import QUINTILES
+from .selection import TIME_BUDGET
+from .shared import BLOCK_SIZE, AtomicPath, process_default
+from .store import evict
+from .validation import MAX_ROWS, validate_file
+
+HOST = '127.0.0.1'
+PORT = 8765
+SERVICE_URL = os.environ.get('RFM_SERVICE_URL')
+# Copias de los ficheros subidos, una por contenido, con expulsión por tamaño como el almacén Arrow
+UPLOAD_DIR = os.environ.get('RFM_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'rfm_uploads'))
+UPLOAD_BYTES = 2 * 1024 * 1024 * 1024
+UPLOAD_EXTENSIONS = ('.csv', '.xlsx')
+# Validaciones e informes de clustering que se conservan en memoria (LRU)
+MEMORY_ENTRIES = 64
+
+
+def frame_to_json(frame):
+    return frame.to_json(orient='table', date_format='iso')
+
+
+def frame_from_json(text):
+    return pd.read_json(io.StringIO(text), orient='table')
+
+
+def report_to_dict(report):
+    # El informe de clustering puede llevar la tabla de selección de k, que viaja como JSON
+    report = dict(report)
+    if 'selection' in report:
+        report['selection'] = frame_to_json(report['selection'])
+    return report
+
+
+def report_from_dict(report):
+    report = dict(report)
+    if 'selection' in report:
+        report['selection'] = frame_from_json(report['selection'])
+    return report
+
+
+class Service:
+    # Estado compartido del proceso. Todos los métodos devuelven objetos de pandas/rfm o dicts serializables
+    # a JSON, y client.Client expone exactamente los mismos métodos por HTTP
+
+    def __init__(self, upload_dir=UPLOAD_DIR, cache=None, queue=None, model_dir=MODEL_DIR, time_budget=TIME_BUDGET):
+        self.upload_dir = upload_dir
+        self.model_dir = model_dir
+        # Segundos para elegir k con n_clusters='auto' (ver selection.select_k); forma parte de la clave
+        self.time_budget = time_budget
+        self.cache = cache or default_cache()
+        self.queue = queue or default_queue()
+        self._validations = ResultCache(directory=None, max_entries=MEMORY_ENTRIES)
+        self._reports = ResultCache(directory=None, max_entries=MEMORY_ENTRIES)
+        self._running = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _digest_lock(self, digest):
+        with self._lock:
+            return self._locks.setdefault(digest, threading.Lock())
+
+    def upload_path(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(self.upload_dir, f'{digest}{extension if extension in UPLOAD_EXTENSIONS else ".csv"}')
+
+    def upload(self, source, name, max_rows=MAX_ROWS):
+        # Guarda una copia del fichero (una por contenido) y lo valida una sola vez aunque lo suban varias
+        # sesiones a la vez. Devuelve {'digest', 'name', 'issues': Validator}
+        digest = file_digest(source)
+        with self._digest_lock(digest):
+            cached = self._validations.get(digest)
+            path = self.upload_path(digest, name)
+            if not os.path.exists(path):
+                os.makedirs(self.upload_dir, exist_ok=True)
+                source.seek(0)
+                with AtomicPath(path) as tmp, open(tmp, 'wb') as f:
+                    shutil.copyfileobj(source, f, BLOCK_SIZE)
+                source.seek(0)
+                evict(self.upload_dir, UPLOAD_BYTES, suffix=UPLOAD_EXTENSIONS)
+            else:
+                os.utime(path)
+            if cached is None:
+                cached = validate_file(path, digest, max_rows=max_rows)
+                self._validations.put(digest, cached)
+        return {'digest': digest, 'name': name, 'issues': cached}
+
+    def analyze(self, digest, name, mapping, n_clusters, engine, trace=False, refit=False):
+        # Devuelve {'key', 'job'}: job es None si el resultado ya está en la caché. Si otra sesión ya está
+        # calculando el mismo resultado se devuelve su trabajo en lugar de lanzar otro. Los clientes se asignan
+        # con el último modelo de segmentación guardado (su versión forma parte de la clave) salvo refit=True
+        model_version = None if engine == QUINTILES else latest_version(self.model_dir)
+        key = result_key(digest, mapping, n_clusters, engine=engine, time_budget=self.time_budget,
+                         model_version=model_version, refit=refit)
+        if self.cache.get(key) is not None:
+            return {'key': key, 'job': None}
+        path = self.upload_path(digest, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError("El fichero ya no está en el servicio; vuelve a subirlo")
+        with self._lock:
+            job = self.queue.get(self._running.get(key))
+            if job is None or job.status == FAILED:
+                report = {}
+                job = self.queue.submit(self._run_analysis, path, digest, mapping, n_clusters, engine, refit, key,
+                                        report, trace=trace)
+                self._running[key] = job.id
+                self._reports.put(key, report)
+        return {'key': key, 'job': job.id}
+
+    def _run_analysis(self, source, digest, mapping, n_clusters, engine, refit, key, report, on_stage=None):
+        # Se ejecuta en un hilo de la cola: analiza, compacta la tabla por cliente y deja el resultado en la
+        # caché del servicio, la misma en la que miran analyze() y result()
+        cluster_analysis, rfm_data = analyze_file(source, digest, mapping, n_clusters=n_clusters, engine=engine,
+                                                  report=report, refit=refit, model_dir=self.model_dir,
+                                                  time_budget=self.time_budget, on_stage=on_stage)
+        if cluster_analysis is None:
+            return None, None
+        result = (cluster_analysis, compact(rfm_data))
+        self.cache.put(key, result)
+        return result
+
+    def job_status(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        status = {
+            'id': job.id,
+            'status': job.status,
+            'done': job.done,
+            'progress': job.progress,
+            'label': job.label(),
+            'error': job.error,
+            'empty': job.done and job.status != FAILED and job.result[0] is None,
+            'spans': job.tracer.records if job.tracer is not None else None,
+        }
+        if job.done:
+            with self._lock:
+                self._running = {key: running for key, running in self._running.items() if running != job.id}
+        return status
+
+    def result(self, key):
+        # (cluster_analysis, tabla por cliente compacta) o None si no está en la caché
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        # Desde disco llega sin los tipos Arrow/categóricos: se vuelve a compactar
+        if cached[1].index.dtype != 'string[pyarrow]':
+            cached = (cached[0], compact(cached[1]))
+        return cached
+
+    def report(self, key):
+        # Informe del clustering si se calculó en este proceso; {} si el resultado salió de la caché en disco
+        report = self._reports.get(key)
+        return report if report is not None else {}
+
+    def export(self, key, fmt):
+        # Ruta del fichero de descarga, generado una sola vez por resultado (ver exports.py). Un fichero ya
+        # generado se sirve aunque el resultado haya salido de la caché; KeyError si hay que generarlo y no está
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato de exportación desconocido: {fmt}. Opciones: {', '.join(FORMATS)}")
+        path = export_path(key, fmt)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        result = self.result(key)
+        if result is None:
+            raise KeyError(key)
+        return ensure_export(key, fmt, *result)
+
+
+# Servicio dentro del proceso actual, compartido por todas sus sesiones
+default_service = process_default(Service)
+
+
+class Handler(BaseHTTPRequestHandler):
+    # API HTTP del servicio (JSON salvo las tablas por cliente, en Parquet, y las descargas):
+    #   POST /uploads?name=fichero.csv         cuerpo = fichero       -> validación
+    #   POST /analyses                         {digest, name, mapping, n_clusters, engine, trace, refit} -> {key, job}
+    #   GET  /jobs/<id>                        estado y avance del trabajo
+    #   GET  /results/<key>                    {cluster_analysis, report}
+    #   GET  /results/<key>/customers          tabla por cliente en Parquet
+    #   GET  /results/<key>/exports/<formato>  fichero de descarga
+    service = None
+    routes = [
+        ('POST', re.compile(r'/uploads$'), 'post_upload'),
+        ('POST', re.compile(r'/analyses$'), 'post_analysis'),
+        ('GET', re.compile(r'/jobs/(?P<job_id>[\w-]+)$'), 'get_job'),
+        ('GET', re.compile(r'/results/(?P<key>\w+)$'), 'get_result'),
+        ('GET', re.compile(r'/results/(?P<key>\w+)/customers$'), 'get_customers'),
+        ('GET', re.compile(r'/results/(?P<key>\w+)/exports/(?P<fmt>\w+)$'), 'get_export'),
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                try:
+                    getattr(self, handler)(**match.groupdict())
+                except KeyError:
+                    self._send_json({'error': "No encontrado"}, 404)
+                except (ValueError, FileNotFoundError) as e:
+                    self._send_json({'error': str(e)}, 400)
+                except Exception as e:
+                    self._send_json({'error': f'{type(e).__name__}: {e}'}, 500)
+                return
+        self._send_json({'error': "No encontrado"}, 404)
+
+    def _read_json(self):
+        return json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self._send_headers(status, 'application/json', len(body))
+        self.wfile.write(body)
+
+    def _send_headers(self, status, content_type, length):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def _send_file(self, path, content_type):
+        self._send_headers(200, content_type, os.path.getsize(path))
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, BLOCK_SIZE)
+
+    def post_upload(self):
+        # El cuerpo se vuelca a un fichero temporal por bloques: nunca está entero en memoria
+        remaining = int(self.headers.get('Content-Length', 0))
+        with tempfile.TemporaryFile() as f:
+            while remaining > 0:
+                block = self.rfile.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+            upload = self.service.upload(f, self.query.get('name', 'upload.csv'))
+        self._send_json({**upload, 'issues': upload['issues'].to_dict()})
+
+    def post_analysis(self):
+        params = self._read_json()
+        self._send_json(self.service.analyze(params['digest'], params['name'], params['mapping'], params['n_clusters'],
+                                             params['engine'], trace=params.get('trace', False),
+                                             refit=params.get('refit', False)))
+
+    def get_job(self, job_id):
+        status = self.service.job_status(job_id)
+        if status is None:
+            raise KeyError(job_id)
+        self._send_json(status)
+
+    def get_result(self, key):
+        result = self.service.result(key)
+        if result is None:
+            raise KeyError(key)
+        self._send_json({'cluster_analysis': frame_to_json(result[0]),
+                         'report': report_to_dict(self.service.report(key))})
+
+    def get_customers(self, key):
+        result = self.service.result(key)
+        if result is None:
+            raise KeyError(key)
+        body = result[1].to_parquet()
+        self._send_headers(200, 'application/vnd.apache.parquet', len(body))
+        self.wfile.write(body)
+
+    def get_export(self, key, fmt):
+        self._send_file(self.service.export(key, fmt), FORMATS[fmt][2])
+
+    def log_message(self, format, *args):
+        # Sin una línea por petición en stderr: el polling de los trabajos la llenaría
+        pass
+
+
+def serve(host=HOST, port=PORT, service=None):
+    handler = type('ServiceHandler', (Handler,), {'service': service or default_service()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rfm.service', description="Servicio de análisis RFM compartido.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--time-budget', type=float, default=TIME_BUDGET,
+                        help="Segundos para elegir el nº de segmentos con k automático (por defecto %(default)s, RFM_TIME_BUDGET)")
+    args = parser.parse_args(argv)
+    server = serve(args.host, args.port, Service(time_budget=args.time_budget))
+    print(f"Servicio RFM en http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
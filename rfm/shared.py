@@ -0,0 +1,53 @@
+import os
+import threading
+import uuid
+
+# Piezas comunes a la caché, los almacenes, los modelos, las descargas, el servicio y su cliente
+
+# Tamaño de bloque al copiar o leer ficheros por trozos (subidas, descargas, hash del contenido)
+BLOCK_SIZE = 1 << 20
+
+
+class AtomicPath:
+    # Ruta temporal junto a path que se publica de una vez: otro proceso nunca ve un fichero a medias.
+    # commit() la publica con publish (os.replace; os.link para no sobrescribir nunca un fichero ya publicado,
+    # que lanza FileExistsError) y discard() borra lo que quede. Como gestor de contexto devuelve la ruta
+    # temporal, publica al salir sin error y siempre limpia
+
+    def __init__(self, path, publish=os.replace):
+        self.path = path
+        self.tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        self._publish = publish
+
+    def commit(self):
+        try:
+            self._publish(self.tmp, self.path)
+        finally:
+            self.discard()
+
+    def discard(self):
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def __enter__(self):
+        return self.tmp
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def process_default(factory):
+    # Función sin argumentos que devuelve una única instancia por proceso (compartida por todas las sesiones
+    # de Streamlit), creada la primera vez que se pide aunque la pidan varios hilos a la vez
+    instances = []
+    lock = threading.Lock()
+
+    def default():
+        with lock:
+            if not instances:
+                instances.append(factory())
+            return instances[0]
+    return default
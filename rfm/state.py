@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .cache import file_digest
+from .ingest import aggregate_chunks, iter_chunks, sniff
+from .schema import REQUIRED_COLUMNS
+from .scoring import AGGREGATE_COLUMNS, combine_aggregates, finalize
+from .shared import AtomicPath
+
+# Estado RFM acumulado por cliente (última compra, nº de compras y gasto) en un Parquet: cada export
+# diario se agrega y se fusiona con el estado en lugar de recalcular el histórico completo
+STATE_PATH = os.environ.get('RFM_STATE_PATH', os.path.join(tempfile.gettempdir(), 'rfm_state.parquet'))
+
+_METADATA_KEY = b'rfm_state'
+
+
+def load_state(path=STATE_PATH):
+    # Devuelve (agregados por cliente, metadatos); un estado vacío si aún no existe el fichero
+    if not os.path.exists(path):
+        return combine_aggregates([]), {'applied': []}
+    table = pq.read_table(path)
+    metadata = json.loads((table.schema.metadata or {}).get(_METADATA_KEY, b'{"applied": []}'))
+    return table.to_pandas()[AGGREGATE_COLUMNS], metadata
+
+
+def save_state(aggregates, metadata, path=STATE_PATH):
+    table = pa.Table.from_pandas(aggregates[AGGREGATE_COLUMNS])
+    table = table.replace_schema_metadata({**table.schema.metadata, _METADATA_KEY: json.dumps(metadata)})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Escritura atómica: un fallo a mitad nunca deja un estado corrupto
+    with AtomicPath(path) as tmp:
+        pq.write_table(table, tmp)
+
+
+def upsert(state, delta):
+    # Fusiona los agregados de un delta con el estado: los clientes existentes se actualizan por posición
+    # (máximo de la fecha, suma de compras y gasto) y los nuevos se añaden al final, sin agrupar todo el estado
+    if state.empty:
+        return delta[AGGREGATE_COLUMNS].copy()
+    if delta.empty:
+        return state
+    positions = state.index.get_indexer(delta.index)
+    found = positions >= 0
+    hit = positions[found]
+    last_purchase = state['last_purchase'].to_numpy(copy=True)
+    frequency = state['Frequency'].to_numpy(dtype=float, copy=True)
+    monetary = state['Monetary'].to_numpy(dtype=float, copy=True)
+    last_purchase[hit] = np.fmax(last_purchase[hit], delta['last_purchase'].to_numpy()[found])
+    frequency[hit] += delta['Frequency'].to_numpy(dtype=float)[found]
+    monetary[hit] += delta['Monetary'].to_numpy(dtype=float)[found]
+    updated = pd.DataFrame({'last_purchase': last_purchase, 'Frequency': frequency, 'Monetary': monetary},
+                           index=state.index)
+    return pd.concat([updated, delta.loc[~found, AGGREGATE_COLUMNS]])
+
+
+def ingest_delta(source, path=STATE_PATH, mapping=None, name=None, subscribed_only=True, options=None):
+    # Agrega un fichero de nuevas transacciones por trozos y lo fusiona con el estado guardado.
+    # Cada fichero se aplica una sola vez (se recuerda su SHA-256). Devuelve un informe del merge
+    digest = file_digest(source)
+    state, metadata = load_state(path)
+    report = {'digest': digest, 'applied': False, 'new_customers': 0, 'updated_customers': 0}
+    if digest in metadata['applied']:
+        report['customers'] = len(state)
+        return report
+    usecols = [mapping[col] for col in REQUIRED_COLUMNS] if mapping else REQUIRED_COLUMNS
+    if options is None:
+        options = sniff(source, mapping, name=name)
+    chunks = iter_chunks(source, usecols, name=name, mapping=mapping, options=options)
+    delta = aggregate_chunks(chunks, mapping, subscribed_only, date_format=options.get('date_format'))
+    existing = delta.index.isin(state.index)
+    state = upsert(state, delta)
+    metadata['applied'].append(digest)
+    metadata['updated'] = pd.Timestamp.now().isoformat(timespec='seconds')
+    save_state(state, metadata, path)
+    report.update(applied=True, new_customers=int((~existing).sum()), updated_customers=int(existing.sum()),
+                  customers=len(state))
+    return report
+
+
+def rfm_from_state(path=STATE_PATH, now=None):
+    # Tabla RFM del estado acumulado; la recencia se recalcula respecto a `now` (por defecto, el día
+    # siguiente a la última compra registrada) sin volver a leer los ficheros ya aplicados
+    return finalize(load_state(path)[0].sort_index(), now)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .cache import code_version
+from .cleaning import clean
+from .ingest import iter_chunks, sniff
+from .instrument import span
+from .loading import map_columns
+from .schema import DATE, EMAIL, FREQUENCY, MONETARY, NEWSLETTER, REQUIRED_COLUMNS, SUBSCRIBED
+from .scoring import AGGREGATE_COLUMNS, finalize, fold_partials
+from .shared import AtomicPath
+
+# Cada upload se convierte una vez a un fichero Arrow IPC tipado con las cinco columnas RFM;
+# los análisis posteriores lo leen lote a lote (un lote por trozo escrito) sin volver a parsear
+STORE_DIR = os.environ.get('RFM_STORE_DIR', os.path.join(tempfile.gettempdir(), 'rfm_store'))
+# Tamaño máximo del directorio; al superarlo se borran los almacenes usados hace más tiempo
+STORE_BYTES = 2 * 1024 * 1024 * 1024
+
+SCHEMA = pa.schema([
+    (EMAIL, pa.string()),
+    (DATE, pa.timestamp('ns')),
+    (MONETARY, pa.float64()),
+    (FREQUENCY, pa.float64()),
+    (NEWSLETTER, pa.string()),
+])
+
+
+def store_path(digest, mapping=None, directory=STORE_DIR):
+    # Un fichero por contenido, mapeo y versión del código: remapear a otras columnas genera (una vez) su
+    # propio almacén, y un cambio en el parseo o el tipado no reutiliza almacenes escritos por la versión
+    # anterior (los antiguos se acaban borrando por expulsión). Las columnas que se mapean a sí mismas no
+    # cuentan, así que el mapeo por defecto equivale a None
+    mapping = sorted((col, source) for col, source in (mapping or {}).items() if col != source)
+    key = hashlib.sha256(json.dumps([mapping, code_version()]).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(directory, f'{digest}-{key}.arrow')
+
+
+class StoreWriter:
+    # Escribe trozos ya limpios (sin filtrar por newsletter) en un fichero temporal y lo publica al cerrar
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._target = AtomicPath(path)
+        self._writer = pa.ipc.new_file(self._target.tmp, SCHEMA)
+
+    def write(self, chunk):
+        chunk = chunk[REQUIRED_COLUMNS].astype({NEWSLETTER: object})
+        self._writer.write_table(pa.Table.from_pandas(chunk, schema=SCHEMA, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+        self._target.commit()
+        evict(os.path.dirname(self.path))
+
+    def abort(self):
+        self._writer.close()
+        self._target.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def evict(directory=STORE_DIR, max_bytes=STORE_BYTES, suffix='.arrow'):
+    # Borra los ficheros con esa(s) extensión(es) usados hace más tiempo hasta bajar de max_bytes
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(suffix)]
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def convert(source, path, mapping=None, name=None, options=None):
+    # Lee el fichero original por trozos (CSV) o de una vez (Excel) y lo vuelca tipado al almacén
+    usecols = [mapping[col] for col in REQUIRED_COLUMNS] if mapping else REQUIRED_COLUMNS
+    if options is None:
+        options = sniff(source, mapping, name=name)
+    with span('convert') as current, StoreWriter(path) as writer:
+        current.rows_in = current.rows_out = 0
+        for chunk in iter_chunks(source, usecols, name=name, mapping=mapping, options=options):
+            if mapping is not None:
+                chunk = map_columns(chunk, mapping)
+            cleaned = clean(chunk, subscribed_only=False, date_format=options.get('date_format'))
+            writer.write(cleaned)
+            current.rows_in += len(chunk)
+            current.rows_out += len(cleaned)
+    return path
+
+
+def ensure_store(source, digest, mapping=None, name=None, directory=STORE_DIR):
+    path = store_path(digest, mapping, directory)
+    if not os.path.exists(path):
+        convert(source, path, mapping=mapping, name=name)
+    return path
+
+
+def open_store(path):
+    # Lector por lotes: cada lote se lee al pedirlo y se libera al dejar de usarlo (con memory-map las páginas
+    # ya leídas seguirían contando en la memoria del proceso). La fecha de modificación marca el último uso
+    # para la expulsión
+    os.utime(path)
+    return pa.ipc.open_file(pa.OSFile(path, 'r'))
+
+
+def _aggregate_table(table):
+    # Devuelve las columnas con su nombre original para poder volver a agregar los parciales
+    grouped = table.group_by(EMAIL).aggregate([(DATE, 'max'), (FREQUENCY, 'sum'), (MONETARY, 'sum')])
+    return grouped.rename_columns([name.rsplit('_', 1)[0] if name != EMAIL else name
+                                   for name in grouped.column_names])
+
+
+def _combine_tables(parts):
+    return _aggregate_table(pa.concat_tables(parts) if parts else SCHEMA.empty_table())
+
+
+def rfm_from_store(path, subscribed_only=True, now=None):
+    # Agregación por cliente con Arrow lote a lote: cada lote se filtra y agrega por separado, así que en
+    # memoria solo hay un lote cada vez, y los parciales se fusionan por tandas como en ingest.aggregate_chunks
+    reader = open_store(path)
+    with span('aggregate') as current:
+        current.rows_in = 0
+
+        def partials():
+            for i in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(i)])
+                current.rows_in += table.num_rows
+                if subscribed_only:
+                    table = table.filter(pc.equal(table[NEWSLETTER], SUBSCRIBED))
+                yield _aggregate_table(table.filter(pc.is_valid(table[EMAIL])))
+
+        grouped = fold_partials(partials(), _combine_tables)
+        aggregates = grouped.to_pandas().set_index(EMAIL).sort_index()
+        aggregates = aggregates.rename(columns={
+            DATE: 'last_purchase',
+            FREQUENCY: 'Frequency',
+            MONETARY: 'Monetary',
+        })[AGGREGATE_COLUMNS]
+        rfm = finalize(aggregates, now)
+        current.rows_out = len(rfm)
+    return rfm
@@ -0,0 +1,80 @@
+SEGMENT_NAMES = ["Clientes Campeones", "Clientes Leales", "Potencialmente Leales", "Clientes en Riesgo", "Clientes Dormidos"]
+
+SEGMENT_ACTIONS = {
+    "Clientes Campeones": [
+        "Recompensar su lealtad con acceso anticipado a productos, descuentos exclusivos o un programa VIP.",
+        "Solicitar testimonios o reseñas de productos.",
+        "Fomentar la recomendación a través de un programa de referidos.",
+    ],
+    "Clientes Leales": [
+        "Ofrecer productos complementarios (cross-selling) o versiones premium (up-selling).",
+        "Mantener el engagement con contenido de valor sobre panadería y recetas.",
+        "Programas de puntos o fidelización para incentivar la recurrencia.",
+    ],
+    "Potencialmente Leales": [
+        "Ofrecer descuentos especiales o promociones para incentivar una nueva compra.",
+        "Realizar encuestas para conocer mejor sus intereses y necesidades.",
+        "Crear campañas de email marketing personalizadas basadas en sus compras anteriores.",
+    ],
+    "Clientes en Riesgo": [
+        "Campañas de reactivación con ofertas atractivas ('Te echamos de menos').",
+        "Enviar comunicaciones personalizadas para recordarles el valor de la marca.",
+        "Ofrecer un descuento significativo en su próxima compra para recuperarlos.",
+    ],
+    "Clientes Dormidos": [
+        "Realizar una campaña de 'última oportunidad' antes de moverlos a una lista de baja frecuencia de envío.",
+        "Intentar reactivarlos con una oferta muy potente o un regalo.",
+        "Si no responden, reducir la frecuencia de comunicación para no afectar la entregabilidad general.",
+    ],
+}
+
+
+def segment_name(position):
+    return SEGMENT_NAMES[position] if position < len(SEGMENT_NAMES) else f"Segmento {position + 1}"
+
+
+def summarize(rfm):
+    # Media de R, F, M y tamaño de cada cluster, ordenados de mejor a peor (baja R, alta F y M)
+    cluster_analysis = rfm.groupby('Cluster').agg({
+        'Recency': 'mean',
+        'Frequency': 'mean',
+        'Monetary': 'mean',
+        'Cluster': 'size'
+    }).rename(columns={'Cluster': 'Count'})
+    return cluster_analysis.sort_values(by=['Recency', 'Frequency', 'Monetary'], ascending=[True, False, False])
+
+
+def segment_labels(cluster_analysis):
+    return [segment_name(i) for i in range(len(cluster_analysis))]
+
+
+def named_summary(cluster_analysis):
+    # Tabla de segmentos con su nombre, sin los que no tienen clientes (los ids vacíos del motor por quintiles
+    # o de un modelo guardado siguen en cluster_analysis con Count 0 para no mover los nombres de los demás)
+    summary = cluster_analysis.copy()
+    summary.insert(0, 'Segmento', segment_labels(cluster_analysis))
+    return summary[summary['Count'] > 0]
+
+
+def segment_map(cluster_analysis):
+    # {id de cluster: nombre de segmento} según el orden de valor de summarize()
+    return {cluster_id: segment_name(i) for i, cluster_id in enumerate(cluster_analysis.index)}
+
+
+def assign_segments(rfm, cluster_analysis):
+    rfm = rfm.copy()
+    rfm['Segmento'] = rfm['Cluster'].map(segment_map(cluster_analysis))
+    return rfm
+
+
+def generate_report_text(cluster_analysis):
+    report_lines = ["# Informe de Análisis de Segmentación de Clientes RFM\n\n"]
+    report_lines.append("## Resumen de los Segmentos\n")
+    summary = named_summary(cluster_analysis)
+    report_lines.append(summary.to_markdown(index=False))
+    report_lines.append("\n\n## Propuestas de Acción por Segmento\n")
+    for cluster_id, data in summary.iterrows():
+        report_lines.append(f"### {data['Segmento']} ({int(data['Count'])} clientes)\n")
+        report_lines.append(f"- **Características:** Recencia media de **{int(data['Recency'])} días**, Frecuencia media de **{data['Frequency']:.1f} compras**, Gasto medio de **{data['Monetary']:.2f} €**.\n")
+        report_lines.append("\n")
+    return "\n".join(report_lines)
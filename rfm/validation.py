@@ -0,0 +1,152 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cleaning import clean
+from .ingest import iter_chunks, sniff
+from .instrument import span
+from .parsing import parse_dates, parse_numeric_report
+from .schema import DATE, EMAIL, NUMERIC_COLUMNS, REQUIRED_COLUMNS
+from .store import StoreWriter, store_path
+
+# Problemas que detecta la validación; los de BLOCKING impiden lanzar el análisis
+ISSUES = {
+    'empty': "Celdas vacías en columnas obligatorias",
+    'bad_date': "Fechas con formato no válido",
+    'bad_amount': "Importes o nº de compras no numéricos",
+    'bad_email': "Correos electrónicos no válidos",
+    'duplicate': "Filas duplicadas",
+}
+BLOCKING = ('empty', 'bad_date', 'bad_amount')
+# Filas de ejemplo que se guardan por problema para mostrarlas
+MAX_ROWS = 1000
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s.]+'
+
+
+def valid_emails(series):
+    # Con cadenas Arrow la expresión regular se evalúa en C sobre toda la columna; los nulos cuentan como válidos
+    # (ya los cuenta el problema 'empty')
+    return series.astype('string[pyarrow]').str.fullmatch(EMAIL_PATTERN).fillna(True).astype(bool)
+
+
+class Validator:
+    # Valida un fichero trozo a trozo en una sola pasada: para cada trozo calcula a la vez las máscaras de
+    # todos los problemas y devuelve el trozo con fechas e importes ya convertidos, listo para clean().
+    # Acumula el nº de filas por problema y hasta max_rows filas de ejemplo; los duplicados se resuelven
+    # en finish() con un hash por fila, también entre trozos distintos
+
+    def __init__(self, options=None, max_rows=MAX_ROWS):
+        self.options = options or {}
+        self.max_rows = max_rows
+        self.n_rows = 0
+        self.counts = dict.fromkeys(ISSUES, 0)
+        self._examples = {issue: [] for issue in ISSUES}
+        self._hashes = []
+        self._index = []
+
+    def check(self, chunk):
+        self.n_rows += len(chunk)
+        empty = chunk.isnull().any(axis=1)
+        dates = parse_dates(chunk[DATE], self.options.get('date_format'))
+        typed = {DATE: dates}
+        bad_amount = pd.Series(False, index=chunk.index)
+        for col in NUMERIC_COLUMNS:
+            typed[col], malformed = parse_numeric_report(chunk[col], self.options.get('decimal'),
+                                                         self.options.get('thousands'))
+            bad_amount |= malformed
+        self._record('empty', empty, chunk)
+        self._record('bad_date', dates.isna() & ~empty, chunk)
+        self._record('bad_amount', bad_amount & ~empty, chunk)
+        self._record('bad_email', ~valid_emails(chunk[EMAIL]), chunk)
+        self._hashes.append(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+        self._index.append(chunk.index.to_numpy())
+        return chunk.assign(**typed)
+
+    def _record(self, issue, mask, chunk):
+        count = int(mask.sum())
+        if not count:
+            return
+        self.counts[issue] += count
+        room = self.max_rows - sum(len(rows) for rows in self._examples[issue])
+        if room > 0:
+            self._examples[issue].append(chunk[mask].head(room))
+
+    def finish(self):
+        # La primera aparición de una fila no cuenta como duplicada, solo las repeticiones
+        if self._hashes:
+            duplicated = pd.Series(np.concatenate(self._hashes)).duplicated().to_numpy()
+            self.counts['duplicate'] = int(duplicated.sum())
+            self.duplicate_rows = np.concatenate(self._index)[duplicated][:self.max_rows]
+        else:
+            self.duplicate_rows = np.array([], dtype=np.int64)
+        self._hashes = self._index = None
+        return self
+
+    def rows(self, issue):
+        # Filas de ejemplo de un problema; de los duplicados solo se conserva el nº de fila
+        if issue == 'duplicate':
+            return pd.DataFrame(index=pd.Index(self.duplicate_rows, name="Fila"))
+        examples = self._examples[issue]
+        return pd.concat(examples) if examples else pd.DataFrame()
+
+    @property
+    def blocking(self):
+        return [issue for issue in BLOCKING if self.counts[issue]]
+
+    def summary(self):
+        frame = pd.DataFrame({
+            "Problema": [ISSUES[issue] for issue in ISSUES],
+            "Filas": [self.counts[issue] for issue in ISSUES],
+            "Bloquea el análisis": [issue in BLOCKING for issue in ISSUES],
+        }, index=pd.Index(list(ISSUES), name="Código"))
+        return frame[frame["Filas"] > 0]
+
+    def to_dict(self):
+        # Para enviar el resultado de la validación por HTTP (ver service.py); las filas de ejemplo van como JSON
+        return {
+            'options': self.options,
+            'max_rows': self.max_rows,
+            'n_rows': self.n_rows,
+            'counts': self.counts,
+            'examples': {issue: self.rows(issue).to_json(orient='table', date_format='iso')
+                         for issue in ISSUES if issue != 'duplicate' and self.counts[issue]},
+            'duplicate_rows': self.duplicate_rows.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        validator = cls(data['options'], data['max_rows'])
+        validator.n_rows = data['n_rows']
+        validator.counts.update(data['counts'])
+        for issue, rows in data['examples'].items():
+            validator._examples[issue] = [pd.read_json(io.StringIO(rows), orient='table')]
+        validator.duplicate_rows = np.asarray(data['duplicate_rows'], dtype=np.int64)
+        validator._hashes = validator._index = None
+        return validator
+
+
+def validate_file(source, digest, name=None, max_rows=MAX_ROWS):
+    # Valida un fichero (ruta o fichero abierto) en una sola lectura y, si aún no existe, escribe su almacén
+    # Arrow con el mapeo por defecto reutilizando las fechas e importes ya convertidos por el Validator
+    options = sniff(source, name=name)
+    path = store_path(digest)
+    writer = None if os.path.exists(path) else StoreWriter(path)
+    validator = Validator(options, max_rows=max_rows)
+    try:
+        with span('validate') as current:
+            current.rows_in = 0
+            for chunk in iter_chunks(source, REQUIRED_COLUMNS, name=name, options=options):
+                current.rows_in += len(chunk)
+                typed = validator.check(chunk)
+                if writer is not None:
+                    writer.write(clean(typed, subscribed_only=False))
+            validator.finish()
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+    return validator
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Los tests importan los módulos de la raíz del repositorio (mailchimp_api, rfm) sin instalarlos
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# Modelos, almacenes, cachés y descargas en un directorio propio de la sesión de tests, no en los del usuario
+_work_dir = tempfile.mkdtemp(prefix='rfm_tests_')
+for variable, name in [('RFM_MODEL_DIR', 'models'), ('RFM_STORE_DIR', 'store'), ('RFM_CACHE_DIR', 'cache'),
+                       ('RFM_EXPORT_DIR', 'exports'), ('RFM_UPLOAD_DIR', 'uploads'),
+                       ('RFM_STATE_PATH', 'rfm_state.parquet')]:
+    os.environ[variable] = os.path.join(_work_dir, name)
+
+from rfm.schema import REQUIRED_COLUMNS  # noqa: E402
+
+
+def synthetic_rows(n_rows, seed=0, n_customers=None):
+    # Filas con el formato de los exports reales: importes "1.234,56", fechas DD/MM/AAAA, varias filas por
+    # cliente y una mezcla de suscritos Si/No
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or max(n_rows // 4, 1)
+    cents = rng.integers(100, 250_000, n_rows)
+    euros = cents // 100
+    amounts = [f'{e // 1000}.{e % 1000:03d},{c % 100:02d}' if e >= 1000 else f'{e},{c % 100:02d}'
+               for e, c in zip(euros, cents)]
+    dates = (pd.Timestamp('2024-12-31') - pd.to_timedelta(rng.integers(0, 1500, n_rows), unit='D')).strftime('%d/%m/%Y')
+    return pd.DataFrame({
+        REQUIRED_COLUMNS[0]: [f'cliente{i}@email.com' for i in rng.integers(0, n_customers, n_rows)],
+        REQUIRED_COLUMNS[1]: dates,
+        REQUIRED_COLUMNS[2]: amounts,
+        REQUIRED_COLUMNS[3]: rng.integers(1, 10, n_rows),
+        REQUIRED_COLUMNS[4]: np.where(rng.random(n_rows) < 0.7, 'Si', 'No'),
+    })
+
+
+@pytest.fixture
+def make_export(tmp_path):
+    # make_export(filas o nº de filas, nombre) escribe un CSV de clientes en tmp_path y devuelve su ruta
+    def make(rows, name='clientes.csv', seed=0):
+        if isinstance(rows, int):
+            rows = synthetic_rows(rows, seed)
+        elif not isinstance(rows, pd.DataFrame):
+            rows = pd.DataFrame(rows, columns=REQUIRED_COLUMNS)
+        path = tmp_path / name
+        rows.to_csv(path, index=False)
+        return str(path)
+
+    return make
@@ -0,0 +1,255 @@
+# Exportación a Mailchimp contra un servidor HTTP local que imita /3.0/batches: envío del batch, consulta del
+# estado hasta "finished", lectura del .tar.gz de resultados, PUT directos con concurrencia acotada y
+# reintentos ante 429/5xx (salvo en el canje del código OAuth)
+import io
+import json
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import mailchimp_api
+
+
+def results_archive(results, files=1):
+    # .tar.gz como el de Mailchimp: los resultados repartidos en varios JSON dentro de un directorio
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        info = tarfile.TarInfo('results')
+        info.type = tarfile.DIRTYPE
+        archive.addfile(info)
+        for i in range(files):
+            data = json.dumps(results[i::files]).encode('utf-8')
+            info = tarfile.TarInfo(f'results/{i}.json')
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Respuestas por (método, ruta): una lista de (código, cabeceras, cuerpo) que se consume en orden;
+    # la última se repite. Cada petición queda registrada en server.requests
+    def _respond(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append({'method': self.command, 'path': self.path, 'headers': dict(self.headers),
+                                     'body': body, 'time': time.monotonic()})
+        queue = self.server.routes.get((self.command, self.path))
+        if not queue:
+            status, headers, payload = 404, {}, {'title': 'Not Found'}
+        else:
+            status, headers, payload = queue.pop(0) if len(queue) > 1 else queue[0]
+        if callable(payload):
+            payload = payload(body)
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.routes = {}
+    server.requests = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub):
+    with requests.Session() as session:
+        yield mailchimp_api.MailchimpClient('token', stub.url, session=session, max_retries=3)
+
+
+def requests_to(stub, method, path):
+    return [request for request in stub.requests if request['method'] == method and request['path'] == path]
+
+
+def test_export_members_submits_polls_and_reads_results(stub, client):
+    emails = ['a@example.com', 'b@example.com', 'c@example.com']
+    results = [
+        {'operation_id': 'a@example.com', 'status_code': 200, 'response': '{}'},
+        {'operation_id': 'b@example.com', 'status_code': 400,
+         'response': json.dumps({'title': 'Invalid Resource', 'detail': 'b@example.com looks fake'})},
+    ]
+    stub.routes[('POST', '/3.0/batches')] = [(200, {}, {'id': 'batch1', 'status': 'pending'})]
+    stub.routes[('GET', '/3.0/batches/batch1')] = [
+        (200, {}, {'id': 'batch1', 'status': 'pending', 'finished_operations': 0}),
+        (200, {}, {'id': 'batch1', 'status': 'started', 'finished_operations': 2}),
+        (200, {}, {'id': 'batch1', 'status': 'finished', 'finished_operations': 3,
+                   'response_body_url': f'{stub.url}/results/batch1.tar.gz'}),
+    ]
+    stub.routes[('GET', '/results/batch1.tar.gz')] = [(200, {}, results_archive(results, files=2))]
+    progress = []
+
+    frame = mailchimp_api.export_members(client, 'list1', emails, poll_interval=0.01, direct_max=0,
+                                         on_progress=lambda done, total: progress.append((done, total)))
+
+    # Un solo batch con un PUT por email a la ruta del hash MD5 del miembro
+    (submitted,) = requests_to(stub, 'POST', '/3.0/batches')
+    assert submitted['headers']['Authorization'] == 'OAuth token'
+    operations = json.loads(submitted['body'])['operations']
+    assert [operation['operation_id'] for operation in operations] == emails
+    assert operations[0]['method'] == 'PUT'
+    assert operations[0]['path'] == f"/lists/list1/members/{mailchimp_api.subscriber_hash('a@example.com')}"
+    assert json.loads(operations[0]['body']) == {'email_address': 'a@example.com', 'status_if_new': 'subscribed'}
+    # Estado consultado hasta "finished"; la URL prefirmada de resultados se pide sin autorización
+    assert len(requests_to(stub, 'GET', '/3.0/batches/batch1')) == 3
+    (download,) = requests_to(stub, 'GET', '/results/batch1.tar.gz')
+    assert 'Authorization' not in download['headers']
+    assert progress[0] == (0, 3) and progress[-1] == (3, 3)
+
+    rows = frame.set_index('Correo electrónico')
+    assert rows.loc['a@example.com', 'Exportado']
+    assert rows.loc['b@example.com', 'Código'] == 400
+    assert rows.loc['b@example.com', 'Detalle'] == 'b@example.com looks fake'
+    # El email que no aparece en el fichero de resultados se marca como no exportado
+    assert not rows.loc['c@example.com', 'Exportado']
+    assert rows.loc['c@example.com', 'Detalle'] == 'Sin respuesta de Mailchimp'
+
+
+def test_export_members_splits_batches(stub, client):
+    emails = [f'user{i}@example.com' for i in range(5)]
+    batches = iter(['batch1', 'batch2', 'batch3'])
+
+    def submit(body):
+        batch_id = next(batches)
+        operations = json.loads(body)['operations']
+        results = [{'operation_id': operation['operation_id'], 'status_code': 200} for operation in operations]
+        stub.routes[('GET', f'/3.0/batches/{batch_id}')] = [
+            (200, {}, {'id': batch_id, 'status': 'finished', 'response_body_url': f'{stub.url}/{batch_id}.tar.gz'})]
+        stub.routes[('GET', f'/{batch_id}.tar.gz')] = [(200, {}, results_archive(results))]
+        return {'id': batch_id}
+
+    stub.routes[('POST', '/3.0/batches')] = [(200, {}, submit)]
+
+    frame = mailchimp_api.export_members(client, 'list1', emails + emails[:1], batch_size=2, poll_interval=0.01,
+                                         direct_max=0)
+
+    assert len(requests_to(stub, 'POST', '/3.0/batches')) == 3
+    assert frame['Correo electrónico'].tolist() == emails
+    assert frame['Exportado'].all()
+
+
+def member_path(email):
+    return f"/3.0/lists/list1/members/{mailchimp_api.subscriber_hash(email)}"
+
+
+def test_export_members_upserts_small_segments_with_bounded_concurrency(stub, client):
+    emails = [f'user{i}@example.com' for i in range(12)]
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def member(body):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {'email_address': json.loads(body)['email_address']}
+
+    for email in emails:
+        stub.routes[('PUT', member_path(email))] = [(200, {}, member)]
+    stub.routes[('PUT', member_path(emails[0]))] = [(400, {}, {'title': 'Invalid Resource', 'detail': 'fake'})]
+    progress = []
+
+    frame = mailchimp_api.export_members(client, 'list1', emails, on_progress=lambda done, total: progress.append(done))
+
+    # Sin batches: un PUT por email, como mucho MAX_WORKERS a la vez
+    assert not requests_to(stub, 'POST', '/3.0/batches')
+    assert len([request for request in stub.requests if request['method'] == 'PUT']) == len(emails)
+    assert 1 < peak[0] <= mailchimp_api.MAX_WORKERS
+    assert progress[-1] == len(emails)
+    rows = frame.set_index('Correo electrónico')
+    assert rows['Exportado'].sum() == len(emails) - 1
+    assert rows.loc[emails[0], 'Detalle'] == 'fake'
+
+
+def test_exchange_code_is_not_replayed(stub, client):
+    # Un 5xx (o un timeout de lectura) puede llegar después de que Mailchimp consumiera el código
+    stub.routes[('POST', '/oauth2/token')] = [(503, {}, {'error': 'unavailable'}), (200, {}, {'access_token': 't'})]
+    with pytest.raises(requests.HTTPError):
+        mailchimp_api.exchange_code(client, f'{stub.url}/oauth2/token', {'code': 'abc'})
+    assert len(requests_to(stub, 'POST', '/oauth2/token')) == 1
+    assert mailchimp_api.exchange_code(client, f'{stub.url}/oauth2/token', {'code': 'abc'}) == 't'
+
+
+def test_exchange_code_retries_failed_connections(monkeypatch):
+    # Si no se llegó a conectar la petición no se envió y sí se puede repetir
+    monkeypatch.setattr(mailchimp_api, 'BACKOFF_BASE', 0.01)
+    calls = []
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                raise requests.ConnectTimeout()
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"access_token": "t"}'
+            return response
+
+    client = mailchimp_api.MailchimpClient(session=Session(), max_retries=3)
+    assert mailchimp_api.exchange_code(client, 'https://login.example/oauth2/token', {'code': 'abc'}) == 't'
+    assert len(calls) == 2
+
+
+def test_wait_for_batch_times_out(stub, client):
+    stub.routes[('GET', '/3.0/batches/slow')] = [(200, {}, {'id': 'slow', 'status': 'started'})]
+    with pytest.raises(TimeoutError):
+        mailchimp_api.wait_for_batch(client, 'slow', poll_interval=0.01, timeout=0.05)
+
+
+def test_read_batch_results_joins_all_json_files(stub, client):
+    results = [{'operation_id': f'user{i}@example.com', 'status_code': 200} for i in range(7)]
+    stub.routes[('GET', '/out.tar.gz')] = [(200, {}, results_archive(results, files=3))]
+    read = mailchimp_api.read_batch_results(client, f'{stub.url}/out.tar.gz')
+    assert sorted(result['operation_id'] for result in read) == sorted(result['operation_id'] for result in results)
+
+
+def test_request_retries_429_respecting_retry_after(stub, client):
+    stub.routes[('GET', '/3.0/lists')] = [
+        (429, {'Retry-After': '0.3'}, {'title': 'Too Many Requests'}),
+        (200, {}, {'lists': [{'id': 'list1', 'name': 'Clientes'}]}),
+    ]
+    assert mailchimp_api.get_lists(client) == [{'id': 'list1', 'name': 'Clientes'}]
+    first, second = requests_to(stub, 'GET', '/3.0/lists')
+    assert second['time'] - first['time'] >= 0.3
+    assert client.metrics[-1]['Reintentos'] == 1
+    assert client.metrics[-1]['Código'] == 200
+
+
+def test_request_retries_server_errors(stub, client, monkeypatch):
+    monkeypatch.setattr(mailchimp_api, 'BACKOFF_BASE', 0.01)
+    stub.routes[('POST', '/3.0/batches')] = [
+        (503, {}, {'title': 'Service Unavailable'}),
+        (500, {}, {'title': 'Internal Server Error'}),
+        (200, {}, {'id': 'batch1'}),
+    ]
+    assert mailchimp_api.submit_batch(client, [])['id'] == 'batch1'
+    assert len(requests_to(stub, 'POST', '/3.0/batches')) == 3
+
+
+def test_request_gives_up_after_max_retries(stub, client, monkeypatch):
+    monkeypatch.setattr(mailchimp_api, 'BACKOFF_BASE', 0.01)
+    stub.routes[('GET', '/3.0/batches/batch1')] = [(502, {'Retry-After': '0'}, {'title': 'Bad Gateway'})]
+    with pytest.raises(requests.HTTPError):
+        mailchimp_api.get_batch(client, 'batch1')
+    assert len(requests_to(stub, 'GET', '/3.0/batches/batch1')) == client.max_retries + 1
@@ -0,0 +1,65 @@
+# Modelo de segmentación guardado: los análisis siguientes asignan con él (ids y nombres estables) y solo se
+# reajusta si se pide, si no hay modelo o si cambia el nº de segmentos
+import numpy as np
+import pandas as pd
+
+from rfm.clustering import N_CLUSTERS
+from rfm.model import latest_version, segment_with_model
+from rfm.schema import EMAIL
+
+
+def rfm_table(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Recency': rng.integers(1, 1500, n),
+        'Frequency': rng.integers(1, 30, n).astype(float),
+        'Monetary': rng.gamma(2.0, 80.0, n),
+    }, index=pd.Index([f'cliente{i}@email.com' for i in range(n)], name=EMAIL))
+
+
+def test_later_analyses_score_with_the_saved_model(tmp_path):
+    directory = str(tmp_path)
+    first_report, second_report = {}, {}
+    first, first_rfm = segment_with_model(rfm_table(600, 1), n_clusters=4, engine='kmeans', report=first_report,
+                                          directory=directory)
+    assert first_report['refit'] and latest_version(directory) == 1
+    # Otra muestra de la misma base: se asigna con el modelo v1 sin reajustar
+    rfm = rfm_table(600, 2)
+    second, second_rfm = segment_with_model(rfm, n_clusters=4, engine='kmeans', report=second_report,
+                                            directory=directory)
+    assert not second_report['refit'] and second_report['model_version'] == 1
+    assert latest_version(directory) == 1
+    assert list(second.index) == list(first.index)
+    # Mismo cliente, mismos datos: mismo segmento que con el modelo puntuando de nuevo
+    again, again_rfm = segment_with_model(rfm, n_clusters=4, engine='kmeans', directory=directory)
+    pd.testing.assert_series_equal(again_rfm['Segmento'], second_rfm['Segmento'])
+
+
+def test_refit_option_and_new_cluster_count_save_a_new_version(tmp_path):
+    directory = str(tmp_path)
+    segment_with_model(rfm_table(400, 1), n_clusters=4, engine='kmeans', directory=directory)
+    report = {}
+    segment_with_model(rfm_table(400, 1), n_clusters=4, engine='kmeans', refit=True, report=report,
+                       directory=directory)
+    assert report['refit'] and latest_version(directory) == 2
+    report = {}
+    cluster_analysis, _ = segment_with_model(rfm_table(400, 1), n_clusters=3, engine='kmeans', report=report,
+                                             directory=directory)
+    assert report['refit'] and latest_version(directory) == 3 and len(cluster_analysis) == 3
+
+
+def test_quintiles_do_not_use_the_model(tmp_path):
+    report = {}
+    cluster_analysis, _ = segment_with_model(rfm_table(300, 1), engine='quintiles', report=report,
+                                             directory=str(tmp_path))
+    assert 'model_version' not in report and latest_version(str(tmp_path)) is None
+    assert len(cluster_analysis) == 5
+
+
+def test_exhausted_time_budget_falls_back_to_the_default_k(tmp_path):
+    # Sin tiempo para ningún candidato se usa N_CLUSTERS y el informe lo marca para avisar
+    report = {}
+    cluster_analysis, _ = segment_with_model(rfm_table(1000, 1), n_clusters='auto', engine='kmeans', report=report,
+                                             time_budget=0.0, directory=str(tmp_path))
+    assert report['k_fallback'] and report['time_budget'] == 0.0 and report['selection'].empty
+    assert len(cluster_analysis) == N_CLUSTERS
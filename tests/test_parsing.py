@@ -0,0 +1,113 @@
+# Conversión de importes y fechas de los exports: separadores y formato de fecha detectados en una muestra,
+# celdas mal formadas marcadas (o NaT) en lugar de lanzar excepciones
+import numpy as np
+import pandas as pd
+import pytest
+
+from rfm.parsing import (DEFAULT_SEPARATORS, detect_date_format, detect_separators, parse_dates, parse_numeric,
+                         parse_numeric_report)
+
+
+def text(values):
+    return pd.Series(values, dtype=object)
+
+
+@pytest.mark.parametrize('values, expected', [
+    (['1.234,56', '12,50', '3'], (',', '.')),
+    (['1,234.56', '12.50'], ('.', ',')),
+    # El separador repetido es el de miles
+    (['1.234.567'], (',', '.')),
+    (['1,234,567'], ('.', ',')),
+    # Tres decimales tras un único separador es ambiguo ("1.234" puede ser mil o uno): sin votos, formato español
+    (['1.234', '2.500', '12'], DEFAULT_SEPARATORS),
+    (['1,234', '12'], DEFAULT_SEPARATORS),
+    ([], DEFAULT_SEPARATORS),
+])
+def test_detect_separators(values, expected):
+    assert detect_separators(text(values)) == expected
+
+
+def test_detect_separators_votes_by_majority():
+    assert detect_separators(text(['1,234.56', '7.5', '8,25', '12.10'])) == ('.', ',')
+
+
+def test_ambiguous_thousands_use_the_default_format():
+    assert parse_numeric(text(['1.234', '2.500'])).tolist() == [1234.0, 2500.0]
+
+
+def test_parse_numeric_reports_malformed_cells_instead_of_raising():
+    values, malformed = parse_numeric_report(text(['1.234,56', '12,5 €', 'abc', None, ' 7 ', '1\xa0234,00']))
+    np.testing.assert_array_equal(values.to_numpy(), [1234.56, 12.5, np.nan, np.nan, 7.0, 1234.0])
+    # Una celda vacía no está mal formada (la cuenta la validación como vacía)
+    assert malformed.tolist() == [False, False, True, False, False, False]
+
+
+def test_parse_numeric_with_explicit_separators():
+    assert parse_numeric(text(['1,234.56', '0.5']), decimal='.', thousands=',').tolist() == [1234.56, 0.5]
+
+
+def test_parse_numeric_mixed_excel_column():
+    # read_excel deja números junto a texto: los números se respetan y solo se traduce el texto
+    values, malformed = parse_numeric_report(text([1200.5, '1.234,56', 'x', 3]))
+    np.testing.assert_array_equal(values.to_numpy(), [1200.5, 1234.56, np.nan, 3.0])
+    assert malformed.tolist() == [False, False, True, False]
+
+
+def test_parse_numeric_keeps_numeric_columns():
+    values, malformed = parse_numeric_report(pd.Series([1, 2, 3]))
+    assert values.dtype == float and values.tolist() == [1.0, 2.0, 3.0]
+    assert not malformed.any()
+
+
+@pytest.mark.parametrize('values, expected', [
+    (['12/03/2024', '05/01/2023'], '%d/%m/%Y'),
+    (['2024-03-12', '2023-01-05'], '%Y-%m-%d'),
+    (['2024-03-12 10:11:12'], '%Y-%m-%d %H:%M:%S'),
+    ([None, 45000], None),
+])
+def test_detect_date_format(values, expected):
+    assert detect_date_format(text(values)) == expected
+
+
+def test_fixed_width_parser_matches_pandas():
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp('1990-01-01') + pd.to_timedelta(rng.integers(0, 20_000, 5000), unit='D')
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d.%m.%Y'):
+        strings = text(dates.strftime(fmt))
+        pd.testing.assert_series_equal(parse_dates(strings, fmt), pd.to_datetime(strings, format=fmt),
+                                       check_names=False)
+
+
+def test_invalid_dates_become_nat():
+    parsed = parse_dates(text(['12/03/2024', '31/02/2024', '29/02/2024', '29/02/2023', 'xx', None, '32/01/2024']),
+                         '%d/%m/%Y')
+    assert parsed.tolist()[:3] == [pd.Timestamp('2024-03-12'), pd.NaT, pd.Timestamp('2024-02-29')]
+    assert parsed.iloc[3:].isna().all()
+
+
+def test_cells_in_another_format_fall_back_to_day_first():
+    parsed = parse_dates(text(['12/03/2024', '1/3/2024', '12-03-2024', '2024-03-12']), '%d/%m/%Y')
+    assert parsed.tolist() == [pd.Timestamp('2024-03-12'), pd.Timestamp('2024-03-01'), pd.Timestamp('2024-03-12'),
+                               pd.Timestamp('2024-03-12')]
+
+
+def test_times_are_kept():
+    assert parse_dates(text(['2024-03-12 10:11:12']), '%Y-%m-%d %H:%M:%S')[0] == pd.Timestamp('2024-03-12 10:11:12')
+
+
+def test_excel_serials():
+    # Número de serie de Excel: días desde 1899-12-30, con la fracción como hora
+    parsed = parse_dates(pd.Series([45000, 45000.5, np.nan]))
+    assert parsed.tolist()[:2] == [pd.Timestamp('2023-03-15'), pd.Timestamp('2023-03-15 12:00')]
+    assert pd.isna(parsed[2])
+
+
+def test_mixed_excel_date_column():
+    parsed = parse_dates(text([45000, '12/03/2024', pd.Timestamp('2024-01-02'), 'no es fecha']))
+    assert parsed.tolist()[:3] == [pd.Timestamp('2023-03-15'), pd.Timestamp('2024-03-12'), pd.Timestamp('2024-01-02')]
+    assert pd.isna(parsed[3])
+
+
+def test_datetime_columns_are_returned_as_is():
+    series = pd.Series(pd.to_datetime(['2024-03-12', '2023-01-05']))
+    assert parse_dates(series) is series
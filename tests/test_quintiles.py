@@ -0,0 +1,62 @@
+# Motor por quintiles: puntuaciones de 1 a 5, segmentos deterministas en el orden de SEGMENT_NAMES y
+# segmentos vacíos con Count 0, medias NaN y fuera del informe
+import numpy as np
+import pandas as pd
+
+from rfm.cli import write_outputs
+from rfm.pipeline import segment
+from rfm.quintiles import QUINTILES, quintile_score
+from rfm.schema import EMAIL
+from rfm.summary import SEGMENT_NAMES, generate_report_text, named_summary
+
+
+def rfm_table(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Recency': rng.integers(1, 1500, n),
+        'Frequency': rng.integers(1, 30, n).astype(float),
+        'Monetary': rng.gamma(2.0, 80.0, n),
+    }, index=pd.Index([f'cliente{i}@email.com' for i in range(n)], name=EMAIL))
+
+
+def test_scores_split_into_equal_quintiles():
+    values = np.arange(100, dtype=float)
+    scores = quintile_score(values)
+    assert np.bincount(scores)[1:].tolist() == [20] * 5
+    assert scores[0] == 1 and scores[-1] == 5
+    # Recency puntúa al revés: la compra más reciente vale 5
+    reverse = quintile_score(values, reverse=True)
+    assert reverse[0] == 5 and reverse[-1] == 1
+
+
+def test_ties_share_a_score():
+    scores = quintile_score([1, 1, 1, 1, 1, 1, 2, 3, 4, 5])
+    assert len(set(scores[:6])) == 1
+
+
+def test_segments_are_deterministic_and_ordered():
+    rfm = rfm_table(2000)
+    report = {}
+    first, first_rfm = segment(rfm, engine=QUINTILES, report=report)
+    second, second_rfm = segment(rfm.sample(frac=1, random_state=1), engine=QUINTILES)
+    assert report['engine'] == QUINTILES and report['n_clusters'] == len(SEGMENT_NAMES)
+    assert first['Count'].sum() == len(rfm)
+    pd.testing.assert_series_equal(first_rfm['Segmento'], second_rfm['Segmento'].loc[first_rfm.index])
+    assert set(first_rfm['Segmento']) <= set(SEGMENT_NAMES)
+
+
+def test_empty_segments_have_no_means_and_are_skipped(tmp_path):
+    # Todos los clientes iguales: R = 5 y F = M = 1, un único segmento con clientes
+    rfm = pd.DataFrame({'Recency': [10] * 6, 'Frequency': [2.0] * 6, 'Monetary': [30.0] * 6},
+                       index=pd.Index([f'c{i}@email.com' for i in range(6)], name=EMAIL))
+    cluster_analysis, rfm_data = segment(rfm, engine=QUINTILES)
+    assert list(cluster_analysis.index) == list(range(len(SEGMENT_NAMES)))
+    assert cluster_analysis['Count'].tolist() == [0, 0, 6, 0, 0]
+    empty = cluster_analysis[cluster_analysis['Count'] == 0]
+    assert empty[['Recency', 'Frequency', 'Monetary']].isna().all().all()
+    assert named_summary(cluster_analysis)['Segmento'].tolist() == [SEGMENT_NAMES[2]]
+    report = generate_report_text(cluster_analysis)
+    assert SEGMENT_NAMES[2] in report and SEGMENT_NAMES[0] not in report and 'nan' not in report
+    write_outputs(str(tmp_path), cluster_analysis, rfm_data)
+    summary = pd.read_csv(tmp_path / 'resumen.csv')
+    assert summary['Segmento'].tolist() == [SEGMENT_NAMES[2]]
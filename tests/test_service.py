@@ -0,0 +1,89 @@
+# Servicio compartido: ida y vuelta por HTTP con el mismo resultado que en proceso, resultados reutilizados
+# desde la caché y descargas ya generadas que se siguen sirviendo cuando el resultado sale de la caché
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from rfm.cache import ResultCache
+from rfm.client import Client
+from rfm.jobs import JobQueue
+from rfm.schema import REQUIRED_COLUMNS
+from rfm.service import Service, serve
+
+MAPPING = dict(zip(REQUIRED_COLUMNS, REQUIRED_COLUMNS))
+
+
+def make_service(tmp_path, cache=None):
+    return Service(upload_dir=str(tmp_path / 'uploads'), cache=cache or ResultCache(str(tmp_path / 'cache')),
+                   queue=JobQueue(), model_dir=str(tmp_path / 'models'))
+
+
+def run_analysis(backend, queue, path, n_clusters=3, engine='kmeans'):
+    with open(path, 'rb') as f:
+        upload = backend.upload(f, os.path.basename(path))
+    analysis = backend.analyze(upload['digest'], os.path.basename(path), MAPPING, n_clusters, engine)
+    if analysis['job'] is not None:
+        job = queue.wait(analysis['job'], timeout=60)
+        assert job.status == 'done', job.traceback
+    return upload, analysis
+
+
+@pytest.fixture
+def http_client(tmp_path):
+    service = make_service(tmp_path)
+    server = serve('127.0.0.1', 0, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield service, Client(f'http://127.0.0.1:{server.server_address[1]}', export_dir=str(tmp_path / 'downloads'))
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_round_trip_matches_the_service(http_client, make_export):
+    service, client = http_client
+    upload, analysis = run_analysis(client, service.queue, make_export(800, seed=1))
+    assert not upload['issues'].blocking
+    status = client.job_status(analysis['job'])
+    assert status['done'] and status['status'] == 'done' and not status['empty']
+    cluster_analysis, rfm_data = client.result(analysis['key'])
+    expected_analysis, expected_rfm = service.result(analysis['key'])
+    pd.testing.assert_frame_equal(cluster_analysis, expected_analysis, check_dtype=False, check_names=False)
+    pd.testing.assert_series_equal(rfm_data['Segmento'], expected_rfm['Segmento'], check_categorical=False)
+    assert client.report(analysis['key'])['n_clusters'] == 3
+    path = client.export(analysis['key'], 'csv')
+    assert os.path.dirname(path) == client.export_dir
+    with open(path, 'rb') as f, open(service.export(analysis['key'], 'csv'), 'rb') as expected:
+        assert f.read() == expected.read()
+    assert client.result('0' * 64) is None
+
+
+def test_repeated_analysis_is_served_from_the_cache(tmp_path, make_export):
+    service = make_service(tmp_path)
+    path = make_export(600, seed=2)
+    # Con quintiles la clave no depende de la versión del modelo guardado (el primer kmeans crea la v1)
+    upload, first = run_analysis(service, service.queue, path, engine='quintiles')
+    again = service.analyze(upload['digest'], os.path.basename(path), MAPPING, 3, 'quintiles')
+    assert again == {'key': first['key'], 'job': None}
+    # Otra subida del mismo contenido reutiliza la validación ya hecha
+    with open(path, 'rb') as f:
+        assert service.upload(f, 'otro.csv')['issues'] is upload['issues']
+
+
+def test_export_survives_eviction_of_the_result(tmp_path, make_export):
+    service = make_service(tmp_path, cache=ResultCache(directory=None, max_entries=1))
+    _, first = run_analysis(service, service.queue, make_export(500, name='a.csv', seed=3))
+    generated = service.export(first['key'], 'md')
+    # Un segundo análisis desplaza el primero de la caché (una sola entrada, sin disco)
+    run_analysis(service, service.queue, make_export(500, name='b.csv', seed=4))
+    assert service.result(first['key']) is None
+    assert service.export(first['key'], 'md') == generated
+    # Una descarga que nunca se generó ya no se puede crear
+    with pytest.raises(KeyError):
+        service.export(first['key'], 'zip')
+
+
+def test_unknown_export_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_service(tmp_path).export('0' * 64, 'xls')
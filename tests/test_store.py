@@ -0,0 +1,53 @@
+# Agregación del almacén Arrow lote a lote: mismo resultado que el camino por trozos de ingest.aggregate_chunks
+import pandas as pd
+import pytest
+
+from rfm.cleaning import clean
+from rfm.ingest import aggregate_chunks, iter_chunks, sniff
+from rfm.schema import REQUIRED_COLUMNS
+from rfm.scoring import COMBINE_EVERY, finalize, fold_partials
+from rfm.store import StoreWriter, rfm_from_store
+
+NOW = pd.Timestamp('2025-01-01')
+# Filas por lote: con 2000 filas hay más lotes que COMBINE_EVERY y los parciales se fusionan varias veces
+CHUNK_ROWS = 50
+
+
+def write_store(source, path, options):
+    with StoreWriter(path) as writer:
+        for chunk in iter_chunks(source, REQUIRED_COLUMNS, chunksize=CHUNK_ROWS, options=options):
+            writer.write(clean(chunk, subscribed_only=False, date_format=options.get('date_format')))
+    return path
+
+
+@pytest.mark.parametrize('subscribed_only', [True, False])
+def test_store_matches_aggregate_chunks(make_export, tmp_path, subscribed_only):
+    source = make_export(2000)
+    options = sniff(source)
+    store = write_store(source, str(tmp_path / 'store' / 'clientes.arrow'), options)
+    assert 2000 // CHUNK_ROWS > COMBINE_EVERY
+    chunks = iter_chunks(source, REQUIRED_COLUMNS, chunksize=CHUNK_ROWS, options=options)
+    expected = finalize(aggregate_chunks(chunks, subscribed_only=subscribed_only,
+                                         date_format=options.get('date_format')), NOW)
+    result = rfm_from_store(store, subscribed_only=subscribed_only, now=NOW)
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected.sort_index(), check_dtype=False)
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / 'store' / 'vacio.arrow')
+    with StoreWriter(path):
+        pass
+    assert rfm_from_store(path).empty
+
+
+def test_fold_partials_bounds_pending_parts():
+    sizes = []
+
+    def combine(parts):
+        sizes.append(len(parts))
+        return sum(parts)
+
+    assert fold_partials(range(100), combine, every=4) == sum(range(100))
+    assert max(sizes) == 5
+    assert fold_partials([], combine) == 0
@@ -0,0 +1,84 @@
+# Validación en una sola pasada: todas las clases de problema a la vez, duplicados también entre trozos,
+# filas de ejemplo acotadas y el almacén Arrow escrito durante la misma lectura
+import os
+
+import pandas as pd
+
+from rfm.cache import file_digest
+from rfm.jobs import analyze_file
+from rfm.schema import REQUIRED_COLUMNS
+from rfm.store import rfm_from_store, store_path
+from rfm.validation import Validator, validate_file
+
+ROWS = [
+    ('a@email.com', '12/03/2024', '10,50', 1, 'Si'),
+    ('b@email.com', '31/02/2024', '10,50', 1, 'Si'),  # fecha imposible
+    ('c@email.com', '12/03/2024', 'abc', 1, 'Si'),  # importe no numérico
+    ('sin-arroba', '12/03/2024', '1,00', 1, 'No'),  # email no válido
+    ('a@email.com', '12/03/2024', '10,50', 1, 'Si'),  # repetición exacta de la primera fila
+    (None, '12/03/2024', '5', 2, 'Si'),  # celda vacía
+    ('e@email.com', None, '5', 2, 'Si'),  # celda vacía (no cuenta además como fecha mala)
+]
+
+
+def chunk(rows, start=0):
+    return pd.DataFrame(rows, columns=REQUIRED_COLUMNS, index=range(start, start + len(rows)))
+
+
+def test_single_pass_reports_every_issue(make_export):
+    issues = validate_file(make_export(ROWS), 'digest-todos')
+    assert issues.n_rows == len(ROWS)
+    assert issues.counts == {'empty': 2, 'bad_date': 1, 'bad_amount': 1, 'bad_email': 1, 'duplicate': 1}
+    assert issues.blocking == ['empty', 'bad_date', 'bad_amount']
+    assert list(issues.rows('bad_date').index) == [1]
+    assert list(issues.rows('bad_amount').index) == [2]
+    assert list(issues.rows('empty').index) == [5, 6]
+    assert list(issues.rows('duplicate').index) == [4]
+    summary = issues.summary()
+    assert summary.loc['duplicate', 'Filas'] == 1 and not summary.loc['duplicate', 'Bloquea el análisis']
+
+
+def test_clean_file_has_no_issues(make_export):
+    issues = validate_file(make_export(ROWS[:1] + ROWS[3:4]), 'digest-limpio')
+    assert issues.blocking == []
+    assert list(issues.summary().index) == ['bad_email']
+
+
+def test_duplicates_across_chunks():
+    validator = Validator()
+    validator.check(chunk(ROWS[:2]))
+    validator.check(chunk(ROWS[:1] * 3, start=2))
+    validator.finish()
+    assert validator.counts['duplicate'] == 3
+    assert list(validator.rows('duplicate').index) == [2, 3, 4]
+
+
+def test_example_rows_are_capped():
+    validator = Validator(max_rows=3)
+    for start in range(0, 10, 2):
+        validator.check(chunk([('x@email.com', 'mal', '1', 1, 'Si')] * 2, start=start))
+    validator.finish()
+    assert validator.counts['bad_date'] == 10
+    assert len(validator.rows('bad_date')) == 3
+    assert validator.counts['duplicate'] == 9 and len(validator.rows('duplicate')) == 3
+
+
+def test_round_trip_through_dict(make_export):
+    issues = validate_file(make_export(ROWS), 'digest-json')
+    restored = Validator.from_dict(issues.to_dict())
+    assert restored.counts == issues.counts and restored.blocking == issues.blocking
+    pd.testing.assert_frame_equal(restored.rows('bad_amount'), issues.rows('bad_amount'), check_dtype=False)
+    assert list(restored.rows('duplicate').index) == [4]
+
+
+def test_validation_writes_the_store_used_by_the_analysis(make_export):
+    path = make_export(500)
+    digest = file_digest(path)
+    issues = validate_file(path, digest)
+    assert not issues.blocking
+    store = store_path(digest)
+    assert os.path.exists(store)
+    written = rfm_from_store(store)
+    # El análisis reutiliza ese almacén y obtiene los mismos clientes
+    _, rfm = analyze_file(path, digest, n_clusters=3, engine='quintiles')
+    assert set(rfm.index) == set(written.index)